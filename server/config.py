@@ -3,10 +3,13 @@ Server configuration: paths, logging, environment, and global state.
 """
 import os
 import sys
+import atexit
+import heapq
 import logging
+import queue
 import threading
+import time
 from pathlib import Path
-from collections import defaultdict
 
 # Paths (project root = parent of server package)
 _PROJECT_ROOT = Path(__file__).resolve().parent.parent
@@ -37,7 +40,7 @@ except ImportError:
 
 # Logging
 from datetime import datetime
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 
 class EmojiLogFormatter(logging.Formatter):
@@ -108,18 +111,80 @@ class ConsoleColorBracketFormatter(logging.Formatter):
         return f'{prefix}  {line}'
 
 
+class DeferredFormatQueueHandler(QueueHandler):
+    """QueueHandler that enqueues records as-is so %-style messages are formatted on the
+    listener thread rather than the logging (request) thread. In-process queue only."""
+
+    def prepare(self, record):
+        return record
+
+
+LOG_FLUSH_MAX_RECORDS = 100
+LOG_FLUSH_MAX_SECONDS = 0.1
+
+
+class BatchFlushRotatingFileHandler(RotatingFileHandler):
+    """RotatingFileHandler that skips the flush StreamHandler.emit does after every record.
+    BatchFlushQueueListener calls flush_batch() once the queue is drained, so a burst of
+    records shares one buffered write; close() and rollover still flush via stream.close()."""
+
+    def flush(self):
+        pass
+
+    def flush_batch(self):
+        super().flush()
+
+
+class BatchFlushQueueListener(QueueListener):
+    """QueueListener that flushes its handlers whenever it has caught up with the queue,
+    and at least every LOG_FLUSH_MAX_RECORDS records / LOG_FLUSH_MAX_SECONDS under a
+    sustained backlog, so the file never lags far behind."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+
+    def handle(self, record):
+        super().handle(record)
+        self._unflushed += 1
+        if (self.queue.empty() or self._unflushed >= LOG_FLUSH_MAX_RECORDS
+                or time.monotonic() - self._last_flush >= LOG_FLUSH_MAX_SECONDS):
+            for handler in self.handlers:
+                getattr(handler, 'flush_batch', handler.flush)()
+            self._unflushed = 0
+            self._last_flush = time.monotonic()
+
+    def stop(self):
+        """Drain the queue, then flush what the last batch left buffered. Safe to call twice,
+        so os._exit paths can stop the listener themselves before the atexit hook runs."""
+        if self._thread is not None:
+            super().stop()
+        for handler in self.handlers:
+            getattr(handler, 'flush_batch', handler.flush)()
+
+
 LOG_FORMAT = '%(asctime)s | %(levelname)-8s | %(name)s | %(message)s'
 LOG_DATEFMT = '%Y-%m-%d %H:%M:%S'
 log_formatter = EmojiLogFormatter(LOG_FORMAT, datefmt=LOG_DATEFMT)
 dashboard_log_formatter = BracketLevelFormatter(LOG_FORMAT, datefmt=LOG_DATEFMT)
 console_formatter = ConsoleColorBracketFormatter(LOG_FORMAT, datefmt=LOG_DATEFMT)
 
+# None of our formats use caller, thread or process fields, so skip collecting them for every
+# record (the findCaller stack walk in particular); see "Optimization" in the logging HOWTO.
+logging._srcfile = None
+logging.logThreads = False
+logging.logProcesses = False
+logging.logMultiprocessing = False
+
 LOG_FILE = LOG_DIR / f"rianell_{datetime.now().strftime('%Y%m%d')}.log"
 logger = logging.getLogger('Rianell')
 logger.setLevel(logging.DEBUG)
+file_handler = None
+log_listener = None
 if not logger.handlers:
     # Rotate by size so logs/ cannot grow without bound on shared machines (see docs/SECURITY.md).
-    fh = RotatingFileHandler(
+    fh = BatchFlushRotatingFileHandler(
         LOG_FILE,
         maxBytes=10 * 1024 * 1024,
         backupCount=14,
@@ -127,15 +192,19 @@ if not logger.handlers:
         delay=False,
     )
     fh.setLevel(logging.DEBUG)
-    if hasattr(fh.stream, 'reconfigure'):
-        fh.stream.reconfigure(line_buffering=True)
     ch = logging.StreamHandler()
     ch.setLevel(logging.INFO)
     fh.setFormatter(log_formatter)
     ch.setFormatter(console_formatter)
-    logger.addHandler(fh)
-    logger.addHandler(ch)
-file_handler = logger.handlers[0] if logger.handlers else None
+    # Callers only enqueue records; a single listener thread does the file/console writes,
+    # so request threads never block on disk. Stopped at exit to drain the queue; os._exit
+    # skips atexit, so callers that use it must call log_listener.stop() first.
+    log_queue = queue.SimpleQueue()
+    log_listener = BatchFlushQueueListener(log_queue, fh, ch, respect_handler_level=True)
+    logger.addHandler(DeferredFormatQueueHandler(log_queue))
+    log_listener.start()
+    atexit.register(log_listener.stop)
+    file_handler = fh
 
 if _loaded_legacy_root_env:
     logger.warning(
@@ -167,16 +236,74 @@ _svc = os.getenv('SUPABASE_SECRET_KEY') or os.getenv('SUPABASE_SERVICE_KEY')
 SUPABASE_SERVICE_KEY = _svc.strip() if _svc else None
 DATABASE_URL = os.getenv('DATABASE_URL')
 
-# Connection state
-active_connections = defaultdict(set)
-connection_lock = threading.Lock()
-last_activity = defaultdict(float)
+# Connection state, sharded by client IP so requests from different clients do not all
+# serialize on one lock
+CONNECTION_SHARDS = 16
+
+
+class ConnectionShard:
+    """One shard of per-IP connection state, guarded by its own lock."""
+    __slots__ = ('lock', 'active_connections', 'last_activity', 'expiry_heap', 'rejected_connections')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active_connections = {}  # client IP -> number of open handler connections
+        self.last_activity = {}  # client IP -> time.time() of last request
+        # (deadline, client IP), one entry per tracked IP; the cleanup pass pops due entries
+        # and re-arms those whose last_activity has moved on (lazy invalidation)
+        self.expiry_heap = []
+        self.rejected_connections = 0  # over-limit connections turned away since the last cleanup pass
+
+    def touch(self, ip, now):
+        """Record activity for ip at now. Caller holds self.lock."""
+        if ip not in self.last_activity:
+            heapq.heappush(self.expiry_heap, (now + CONNECTION_TIMEOUT, ip))
+        self.last_activity[ip] = now
+
+    def pop_expired(self, now):
+        """Forget IPs idle for more than CONNECTION_TIMEOUT; returns [(ip, idle_seconds, connection_count)].
+        Caller holds self.lock."""
+        expired = []
+        heap = self.expiry_heap
+        while heap and heap[0][0] < now:
+            _, ip = heapq.heappop(heap)
+            last_time = self.last_activity.get(ip)
+            if last_time is None:
+                continue
+            if now - last_time > CONNECTION_TIMEOUT:
+                connection_count = self.active_connections.pop(ip, 0)
+                del self.last_activity[ip]
+                expired.append((ip, now - last_time, connection_count))
+            else:
+                heapq.heappush(heap, (last_time + CONNECTION_TIMEOUT, ip))
+        return expired
+
+
+connection_shards = tuple(ConnectionShard() for _ in range(CONNECTION_SHARDS))
+
+
+def connection_shard(ip):
+    """Return the shard holding connection state for a client IP."""
+    return connection_shards[hash(ip) % CONNECTION_SHARDS]
+
+
 CONNECTION_TIMEOUT = 300
 CLEANUP_INTERVAL = 60
 MAX_CONNECTIONS_PER_IP = 50
+# Cap on connections being served at once; idle keep-alive connections and SSE streams do not
+# count against it
+MAX_WORKER_THREADS = 64
+WORKER_SLOT_WAIT = 5  # seconds a ready connection waits for a free worker before getting a 503
+# Connections waiting for their first or next request are parked without a thread; they are
+# closed after this many idle seconds, and the oldest are closed first beyond the cap
+IDLE_CONNECTION_TIMEOUT = 15
+MAX_IDLE_CONNECTIONS = 256
 
 # SSE
-sse_clients = []
+# Seconds between keepalive comments on an idle stream; a failed write is how a closed tab's
+# stream (and its thread) is reclaimed
+SSE_KEEPALIVE_INTERVAL = 15
+sse_clients = {}  # id(wfile) -> (client IP, wfile) of each open SSE stream
 sse_lock = threading.Lock()
 file_change_event = threading.Event()
 last_file_change_time = None
@@ -13,17 +13,24 @@ import webbrowser
 import socket
 import json
 import threading
+import queue
+import selectors
 import time
 import random
 import csv
-from collections import defaultdict
+from collections import OrderedDict, deque
+from functools import lru_cache
 from pathlib import Path
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from urllib.parse import urlparse, parse_qs, unquote
 import re
 import subprocess
 import logging
+import email.utils
 import gzip
+import io
+import shutil
+import stat
 
 # Server package (config, encryption, requirements, sample_data, supabase)
 from . import config
@@ -37,12 +44,16 @@ from . import supabase_client
 logger = config.logger
 PORT = config.PORT
 HOST = config.HOST
-active_connections = config.active_connections
-connection_lock = config.connection_lock
-last_activity = config.last_activity
+connection_shards = config.connection_shards
+connection_shard = config.connection_shard
 CONNECTION_TIMEOUT = config.CONNECTION_TIMEOUT
 CLEANUP_INTERVAL = config.CLEANUP_INTERVAL
 MAX_CONNECTIONS_PER_IP = config.MAX_CONNECTIONS_PER_IP
+MAX_WORKER_THREADS = config.MAX_WORKER_THREADS
+WORKER_SLOT_WAIT = config.WORKER_SLOT_WAIT
+IDLE_CONNECTION_TIMEOUT = config.IDLE_CONNECTION_TIMEOUT
+MAX_IDLE_CONNECTIONS = config.MAX_IDLE_CONNECTIONS
+SSE_KEEPALIVE_INTERVAL = config.SSE_KEEPALIVE_INTERVAL
 sse_clients = config.sse_clients
 sse_lock = config.sse_lock
 file_change_event = config.file_change_event
@@ -76,6 +87,7 @@ search_supabase_data = supabase_client.search_supabase_data
 export_supabase_data = supabase_client.export_supabase_data
 generate_and_post_sample_data_to_supabase = supabase_client.generate_and_post_sample_data_to_supabase
 get_supabase_service_client = supabase_client.get_supabase_service_client
+probe_supabase_connection = supabase_client.probe_supabase_connection
 supabase_client_ref = supabase_client.supabase_client  # module-level client reference
 check_supabase_availability = supabase_client.check_supabase_availability
 SUPABASE_URL = config.SUPABASE_URL
@@ -106,6 +118,11 @@ except ImportError:
     print("Warning: watchdog library not installed. File watching disabled.")
     print("Install with: pip install watchdog")
 
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None  # /api/log falls back to the stdlib json module
+
 logger.info("=" * 60)
 logger.info("Health App Server - Logging Initialized")
 logger.info(f"Log file: {LOG_FILE}")
@@ -122,6 +139,244 @@ class ThreadingHTTPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
     daemon_threads = True
     allow_reuse_address = True
     timeout = 30  # Socket timeout in seconds
+    request_queue_size = 128  # listen() backlog; socketserver's default of 5 overflows while all workers are busy
+    
+    def __init__(self, *args, **kwargs):
+        # Connections waiting for a request are parked in a selector watched by one thread, so
+        # idle sockets hold no worker. Ready connections go to daemon worker threads kept alive
+        # between jobs (not a ThreadPoolExecutor, whose exit hook would wait on open SSE
+        # streams); at most MAX_WORKER_THREADS are served at once, the rest queue in _pending.
+        self._jobs = queue.SimpleQueue()
+        self._pool_lock = threading.Lock()
+        self._active = 0  # connections holding a worker slot
+        self._workers = 0
+        self._idle_workers = 0
+        self._pending = deque()  # (request, client_address, deadline) waiting for a slot
+        self._pool_local = threading.local()
+        self._selector = selectors.DefaultSelector()
+        self._parked = OrderedDict()  # request -> (client_address, deadline), oldest first
+        self._park_requests = queue.SimpleQueue()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)  # a full wake pipe already means a wake-up is pending
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+        self._closing = False
+        super().__init__(*args, **kwargs)
+        self._watcher = threading.Thread(target=self._watch_connections, name="http-idle-watcher", daemon=True)
+        self._watcher.start()
+    
+    def process_request(self, request, client_address):
+        """Apply the per-IP limit, then park the connection until its request arrives.
+        Runs on the accept thread, so it never waits on a worker."""
+        client_ip = client_address[0]
+        shard = connection_shard(client_ip)
+        with shard.lock:
+            connection_count = shard.active_connections.get(client_ip, 0)
+            over_limit = connection_count >= MAX_CONNECTIONS_PER_IP
+            if over_limit:
+                # Counted here and reported by the cleanup pass rather than logged per connection
+                shard.rejected_connections += 1
+            else:
+                shard.active_connections[client_ip] = connection_count + 1
+                shard.touch(client_ip, time.time())
+        if over_limit:
+            _send_service_unavailable(request, _CONNECTION_LIMIT_503_TAIL)
+            self.shutdown_request(request)
+            return
+        logger.debug("Connection opened: IP %s, Total connections for IP: %d", client_ip, connection_count + 1)
+        self.park_connection(request, client_address)
+    
+    def park_connection(self, request, client_address):
+        """Hand a connection to the watcher thread until it has a request to read (any thread)"""
+        self._park_requests.put((request, client_address))
+        self._wake()
+    
+    def close_connection(self, request, client_address):
+        """Close a connection and drop it from its IP's connection count"""
+        self.shutdown_request(request)
+        client_ip = client_address[0]
+        shard = connection_shard(client_ip)
+        with shard.lock:
+            # The count may already be gone if the cleanup pass expired this IP
+            remaining = shard.active_connections.get(client_ip, 0) - 1
+            if remaining > 0:
+                shard.active_connections[client_ip] = remaining
+            elif remaining == 0:
+                del shard.active_connections[client_ip]
+        logger.debug("Connection closed: IP %s, Remaining connections for IP: %d", client_ip, max(remaining, 0))
+    
+    def detach_worker(self):
+        """Take the calling handler's thread out of the worker pool (for a long-lived SSE stream):
+        its slot goes to the next waiting connection and the thread exits when the stream ends"""
+        self._pool_local.detached = True
+        with self._pool_lock:
+            self._workers -= 1
+            if self._pending:
+                request, client_address, _ = self._pending.popleft()
+                spawn = self._claim_worker_locked()
+            else:
+                self._active -= 1
+                return
+        self._submit((request, client_address), spawn)
+    
+    def _wake(self):
+        try:
+            self._wake_w.send(b'\0')
+        except OSError:
+            pass
+    
+    def _claim_worker_locked(self):
+        """Reserve an idle worker for a job, or count one to be started. Caller holds _pool_lock;
+        returns True if a worker thread must be started."""
+        if self._idle_workers:
+            self._idle_workers -= 1
+            return False
+        self._workers += 1
+        return True
+    
+    def _submit(self, job, spawn):
+        """Queue a job whose worker slot is already taken, starting a worker thread if needed"""
+        if spawn:
+            try:
+                threading.Thread(target=self._worker, name=f"http-worker-{self._workers}", daemon=True).start()
+            except Exception as e:
+                with self._pool_lock:
+                    self._workers -= 1
+                    self._active -= 1
+                logger.error(f"Could not start worker thread: {e}")
+                self.close_connection(*job)
+                return
+        self._jobs.put(job)
+    
+    def _dispatch(self, request, client_address):
+        """Serve a connection whose request has arrived, or queue it while every slot is busy"""
+        with self._pool_lock:
+            if self._active >= MAX_WORKER_THREADS:
+                self._pending.append((request, client_address, time.monotonic() + WORKER_SLOT_WAIT))
+                return
+            self._active += 1
+            spawn = self._claim_worker_locked()
+        self._submit((request, client_address), spawn)
+    
+    def _worker(self):
+        """Serve queued connections until server_close() sends the stop sentinel"""
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            while job is not None:
+                self._serve_connection(*job)
+                if getattr(self._pool_local, 'detached', False):
+                    return  # slot and worker count were handed back by detach_worker()
+                # Keep the slot for the next waiting connection, if any
+                with self._pool_lock:
+                    if self._pending:
+                        request, client_address, _ = self._pending.popleft()
+                        job = (request, client_address)
+                    else:
+                        self._active -= 1
+                        self._idle_workers += 1
+                        job = None
+    
+    def _serve_connection(self, request, client_address):
+        park = False
+        try:
+            handler = self.RequestHandlerClass(request, client_address, self)
+            park = getattr(handler, 'idle_keep_alive', False)
+        except Exception:
+            self.handle_error(request, client_address)
+        if park and not self._closing:
+            self.park_connection(request, client_address)
+        else:
+            self.close_connection(request, client_address)
+    
+    def _watch_connections(self):
+        """Watcher thread: dispatch parked connections once readable, close those idle past
+        IDLE_CONNECTION_TIMEOUT (oldest first beyond MAX_IDLE_CONNECTIONS), and answer 503 to
+        connections that waited WORKER_SLOT_WAIT for a worker"""
+        parked = self._parked
+        while not self._closing:
+            # Wake by the next pending connection's deadline; parked ones only need ~1 s accuracy
+            timeout = 1.0
+            with self._pool_lock:
+                if self._pending:
+                    timeout = min(timeout, max(0.0, self._pending[0][2] - time.monotonic()))
+            try:
+                events = self._selector.select(timeout=timeout)
+            except OSError:
+                if self._closing:
+                    break
+                raise
+            for key, _ in events:
+                request = key.fileobj
+                if request is self._wake_r:
+                    try:
+                        while self._wake_r.recv(4096):
+                            pass
+                    except OSError:
+                        pass
+                    continue
+                self._selector.unregister(request)
+                client_address, _ = parked.pop(request)
+                self._dispatch(request, client_address)
+            
+            now = time.monotonic()
+            while True:
+                try:
+                    request, client_address = self._park_requests.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    self._selector.register(request, selectors.EVENT_READ)
+                except (OSError, ValueError):
+                    self.close_connection(request, client_address)
+                    continue
+                parked[request] = (client_address, now + IDLE_CONNECTION_TIMEOUT)
+            
+            # Same timeout for every entry, so insertion order is deadline order
+            while parked:
+                request, (client_address, deadline) = next(iter(parked.items()))
+                if deadline > now and len(parked) <= MAX_IDLE_CONNECTIONS:
+                    break
+                del parked[request]
+                self._selector.unregister(request)
+                self.close_connection(request, client_address)
+            
+            expired = []
+            with self._pool_lock:
+                while self._pending and self._pending[0][2] <= now:
+                    expired.append(self._pending.popleft())
+            for request, client_address, _ in expired:
+                _send_service_unavailable(request, _SERVER_BUSY_503_TAIL)
+                self.close_connection(request, client_address)
+            if expired:
+                logger.warning(f"All {MAX_WORKER_THREADS} workers busy; answered 503 to {len(expired)} waiting connection(s)")
+    
+    def server_close(self):
+        self._closing = True
+        self._wake()
+        if self._watcher.is_alive() and self._watcher is not threading.current_thread():
+            self._watcher.join(timeout=2)
+        super().server_close()
+        for request, (client_address, _) in list(self._parked.items()):
+            self.close_connection(request, client_address)
+        self._parked.clear()
+        while True:
+            try:
+                self.close_connection(*self._park_requests.get_nowait())
+            except queue.Empty:
+                break
+        with self._pool_lock:
+            pending = [(request, client_address) for request, client_address, _ in self._pending]
+            self._pending.clear()
+            workers, self._workers = self._workers, 0
+        for job in pending:
+            self.close_connection(*job)
+        for _ in range(workers):
+            self._jobs.put(None)
+        self._selector.close()
+        self._wake_r.close()
+        self._wake_w.close()
     
     def server_bind(self):
         """Override to set socket options for better connection handling"""
@@ -136,10 +391,258 @@ class ThreadingHTTPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
             self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
         super().server_bind()
 
+def _header_block(*headers):
+    """Encode (name, value) pairs as raw header lines, as send_header would."""
+    return b''.join(f"{name}: {value}\r\n".encode('latin-1', 'strict') for name, value in headers)
+
+# Constant header blocks appended by end_headers in one step instead of a send_header call each
+_SECURITY_HEADERS = _header_block(
+    ('X-Content-Type-Options', 'nosniff'),
+    ('X-Frame-Options', 'DENY'),
+    ('X-XSS-Protection', '1; mode=block'),
+    ('Referrer-Policy', 'strict-origin-when-cross-origin'),
+    # Permissions-Policy: Restrict browser features for security
+    # Note: Removed 'ambient-light-sensor' and 'document-domain' as they are not recognized features
+    ('Permissions-Policy', (
+        'accelerometer=(), '
+        'autoplay=(), '
+        'camera=(), '
+        'display-capture=(), '
+        'encrypted-media=(), '
+        'fullscreen=(self), '
+        'geolocation=(), '
+        'gyroscope=(), '
+        'magnetometer=(), '
+        'microphone=(), '
+        'midi=(), '
+        'payment=(), '
+        'picture-in-picture=(), '
+        'publickey-credentials-get=(self), '
+        'screen-wake-lock=(), '
+        'sync-xhr=(), '
+        'usb=(), '
+        'web-share=(self), '
+        'xr-spatial-tracking=()'
+    )),
+)
+_CACHE_IMMUTABLE_HEADERS = _header_block(
+    ('Cache-Control', 'public, max-age=31536000, immutable'),
+    ('Pragma', 'public'),
+)
+_CACHE_REVALIDATE_HEADERS = _header_block(
+    ('Cache-Control', 'public, max-age=86400, must-revalidate'),
+)
+_NO_CACHE_HEADERS = _header_block(
+    ('Cache-Control', 'no-cache, no-store, must-revalidate'),
+    ('Pragma', 'no-cache'),
+    ('Expires', '0'),
+)
+
+
+@lru_cache(maxsize=256)
+def _cors_header_block(origin, port, host):
+    """Encoded Access-Control-Allow-Origin line for an (Origin, PORT, Host) triple, b'' to omit it.
+    A page load repeats the same triple for every asset, so the check and encoding run once."""
+    value = http_security.cors_allow_origin_value(origin, port, host)
+    return b'' if value is None else _header_block(('Access-Control-Allow-Origin', value))
+
+
+# Optional files browsers/devtools probe for (source maps, .well-known, Chrome DevTools):
+# answered 204 and their 404s kept out of the log
+_OPTIONAL_FILE_RE = re.compile(r'\.map|\.well-known|devtools', re.IGNORECASE)
+# Their 204 response around the Date value and the CORS line (if any): same security and
+# no-cache headers, in the same order, as end_headers adds
+_OPTIONAL_204_HEAD = b'HTTP/1.1 204 No Content\r\nDate: '
+_OPTIONAL_204_SECURITY = b'\r\n' + _SECURITY_HEADERS
+_OPTIONAL_204_TAIL = _NO_CACHE_HEADERS + b'\r\n'
+
+# 503 responses the server writes itself, before any request is read or handler runs; kept
+# constant so turning connections away stays cheap during a flood
+_SERVICE_UNAVAILABLE_HEAD = b'HTTP/1.1 503 Service Unavailable\r\nDate: '
+
+
+def _service_unavailable_tail(body):
+    """Everything after the Date value of a plain-text 503 that closes the connection."""
+    return (
+        b'\r\n'
+        + _header_block(('Content-Type', 'text/plain; charset=utf-8'),
+                        ('Content-Length', str(len(body))),
+                        ('Connection', 'close'))
+        + _SECURITY_HEADERS + _NO_CACHE_HEADERS + b'\r\n' + body
+    )
+
+
+_CONNECTION_LIMIT_503_TAIL = _service_unavailable_tail(b'Too many connections from this IP\n')
+_SERVER_BUSY_503_TAIL = _service_unavailable_tail(b'Server busy, please retry\n')
+
+
+def _send_service_unavailable(sock, tail):
+    """Write a prebuilt 503 without blocking; the caller closes the socket."""
+    try:
+        sock.setblocking(False)
+        sock.send(_SERVICE_UNAVAILABLE_HEAD + email.utils.formatdate(usegmt=True).encode('latin-1') + tail)
+    except OSError:
+        pass
+
+
+def record_activity(client_ip):
+    """Update the last-activity timestamp for a client IP (under its shard's lock)."""
+    shard = connection_shard(client_ip)
+    with shard.lock:
+        shard.touch(client_ip, time.time())
+
+
+def _request_path(target):
+    """Path part of a request target (query and fragment dropped), as translate_path splits it."""
+    return target.partition('?')[0].partition('#')[0]
+
+
+# Allowed client log level names (as sent to /api/log) -> logging level; anything else logs as INFO
+_CLIENT_LOG_LEVELS = {
+    'INFO': logging.INFO,
+    'ERROR': logging.ERROR,
+    'WARN': logging.WARNING,
+    'WARNING': logging.WARNING,
+    'DEBUG': logging.DEBUG,
+}
+
+
+def _loads_json(raw):
+    """Parse a UTF-8 JSON request body: bytes or a buffer such as a memoryview (orjson when
+    installed; it reads the buffer directly)."""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(str(raw, 'utf-8'))
+
+
+# Per worker thread: a request-body buffer reused across requests (workers are long-lived)
+_body_buffers = threading.local()
+
+
+def _read_body_into_buffer(rfile, length):
+    """Read up to length body bytes into the calling thread's reusable buffer. Returns a
+    memoryview of what was read, valid until this thread reads its next body."""
+    buf = getattr(_body_buffers, 'buf', None)
+    if buf is None or len(buf) < length:
+        buf = _body_buffers.buf = bytearray(length)
+    view = memoryview(buf)[:length]
+    return view[:rfile.readinto(view)]
+
+
+def _dumps_json(obj):
+    """Serialize obj to UTF-8 JSON bytes (orjson when installed)."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode('utf-8')
+
+
+_CLIENT_LOG_OK_BODY = _dumps_json({'status': 'logged'})
+_CLIENT_LOG_ACTIVE_BODY = _dumps_json({'status': 'logging_endpoint_active'})
+_SYNC_LOG_ACTIVE_BODY = _dumps_json({'status': 'sync_logging_endpoint_active'})
+# Constant error bodies shared by the POST endpoints
+_PAYLOAD_TOO_LARGE_BODY = _dumps_json({'error': 'Payload too large'})
+_TOO_MANY_REQUESTS_BODY = _dumps_json({'error': 'Too many requests'})
+_INVALID_JSON_BODY = _dumps_json({'error': 'Invalid JSON'})
+
+# Gzipped static bodies: LRU by filesystem path, ((mtime_ns, size), gzip bytes, or None when
+# gzip does not pay off), bounded by total compressed size. A changed file misses on its new
+# mtime/size and is recompressed.
+GZIP_CACHE_MAX_BYTES = 32 * 1024 * 1024
+_gzip_cache = OrderedDict()
+_gzip_cache_bytes = 0
+_gzip_cache_lock = threading.Lock()
+
+# Small static files held in memory so repeat requests skip open/read: LRU by filesystem path,
+# ((mtime_ns, size), bytes), bounded by total size. A changed file misses and is re-read.
+STATIC_CACHE_MAX_FILE = 256 * 1024
+STATIC_CACHE_MAX_BYTES = 64 * 1024 * 1024
+_static_cache = OrderedDict()
+_static_cache_bytes = 0
+_static_cache_lock = threading.Lock()
+
+
+def _cached_static_body(fs_path, st):
+    """Return the contents of a small regular file from the cache, reading it on a miss (None on error)."""
+    global _static_cache_bytes
+    version = (st.st_mtime_ns, st.st_size)
+    with _static_cache_lock:
+        entry = _static_cache.get(fs_path)
+        if entry is not None and entry[0] == version:
+            _static_cache.move_to_end(fs_path)
+            return entry[1]
+    try:
+        with open(fs_path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    if len(data) != st.st_size:
+        return None  # file changed while reading; let the normal path serve it
+    with _static_cache_lock:
+        old = _static_cache.pop(fs_path, None)
+        if old is not None:
+            _static_cache_bytes -= len(old[1])
+        _static_cache[fs_path] = (version, data)
+        _static_cache_bytes += len(data)
+        while _static_cache_bytes > STATIC_CACHE_MAX_BYTES:
+            _, (_, evicted) = _static_cache.popitem(last=False)
+            _static_cache_bytes -= len(evicted)
+    return data
+
+
+def _cached_gzip_body(fs_path, st):
+    """Return the gzip-compressed contents of a regular file from the cache, compressing it on a
+    miss; None when gzip does not pay off or the file cannot be read."""
+    global _gzip_cache_bytes
+    version = (st.st_mtime_ns, st.st_size)
+    with _gzip_cache_lock:
+        entry = _gzip_cache.get(fs_path)
+        if entry is not None and entry[0] == version:
+            _gzip_cache.move_to_end(fs_path)
+            return entry[1]
+    try:
+        with open(fs_path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    # Compressed outside the lock, so other requests are never held up behind it
+    gz = gzip.compress(data, compresslevel=6)
+    if len(gz) >= len(data) - 50:
+        gz = None
+    with _gzip_cache_lock:
+        old = _gzip_cache.pop(fs_path, None)
+        if old is not None and old[1] is not None:
+            _gzip_cache_bytes -= len(old[1])
+        _gzip_cache[fs_path] = (version, gz)
+        if gz is not None:
+            _gzip_cache_bytes += len(gz)
+        while _gzip_cache_bytes > GZIP_CACHE_MAX_BYTES:
+            _, (_, evicted) = _gzip_cache.popitem(last=False)
+            if evicted is not None:
+                _gzip_cache_bytes -= len(evicted)
+    return gz
+
 class RianellHttpHandler(http.server.SimpleHTTPRequestHandler):
     """Custom handler to set proper MIME types and handle SPA routing"""
     
-    timeout = 30  # Request timeout
+    timeout = 30  # Per-read timeout while a request is in progress (idle connections are parked by the server)
+    # HTTP/1.1 keeps connections open between requests, so every response must carry a
+    # Content-Length (or set close_connection) for the client to find the end of the body.
+    protocol_version = 'HTTP/1.1'
+    # MIME types: SimpleHTTPRequestHandler.guess_type checks this dict by extension
+    # (as-is, then lowercased) before falling back to mimetypes
+    extensions_map = {
+        **http.server.SimpleHTTPRequestHandler.extensions_map,
+        '.js': 'application/javascript',  # Ensure JavaScript files are served with correct MIME type
+        '.mjs': 'application/javascript',
+        '.json': 'application/json',
+        '.css': 'text/css',
+        '.html': 'text/html',
+    }
+    # Buffer wfile (the stdlib default is unbuffered) so the header block and a small body
+    # leave in one send(); handle_one_request flushes after each request
+    wbufsize = 64 * 1024
+    # Static bodies: read/write chunk when sendfile is unavailable
+    send_buffer_size = 1024 * 1024
     
     def __init__(self, *args, **kwargs):
         self.connection_start_time = time.time()
@@ -147,62 +650,59 @@ class RianellHttpHandler(http.server.SimpleHTTPRequestHandler):
         super().__init__(*args, **kwargs)
     
     def handle(self):
-        """Override handle to track connections"""
+        """Serve requests on this connection while the next one is already buffered; an idle
+        keep-alive connection is handed back to the server (idle_keep_alive) instead of holding
+        this worker while it waits. Per-IP accounting is done by the server."""
         self.client_ip = self.client_address[0]
-        thread_id = threading.current_thread().ident
-        
-        # Check connection limit per IP
-        with connection_lock:
-            ip_connections = active_connections.get(self.client_ip, set())
-            if len(ip_connections) >= MAX_CONNECTIONS_PER_IP:
-                logger.warning(f"Connection limit reached for IP {self.client_ip} ({len(ip_connections)} connections)")
-                self.send_error(503, "Too many connections from this IP")
-                return
-            
-            # Track this connection
-            active_connections[self.client_ip].add(thread_id)
-            last_activity[self.client_ip] = time.time()
-            logger.debug(f"Connection opened: IP {self.client_ip}, Thread {thread_id}, Total connections for IP: {len(active_connections[self.client_ip])}")
-        
+        self.idle_keep_alive = False
         try:
-            super().handle()
+            self.close_connection = True
+            self.handle_one_request()
+            while not self.close_connection:
+                if not self._next_request_buffered():
+                    self.idle_keep_alive = True
+                    break
+                self.handle_one_request()
         except (ConnectionAbortedError, ConnectionResetError, BrokenPipeError, OSError) as e:
             # These are normal when clients disconnect (page reload, tab close, etc.)
             # Only log at debug level to reduce noise
-            logger.debug(f"Client disconnected: IP {self.client_ip}, Thread {thread_id}, Error: {type(e).__name__}")
+            self.idle_keep_alive = False
+            logger.debug("Client disconnected: IP %s, Error: %s", self.client_ip, type(e).__name__)
         except Exception as e:
             # Log unexpected errors
-            logger.error(f"Unexpected error handling request: IP {self.client_ip}, Thread {thread_id}, Error: {e}", exc_info=True)
-        finally:
-            # Remove connection tracking
-            with connection_lock:
-                if self.client_ip in active_connections:
-                    active_connections[self.client_ip].discard(thread_id)
-                    if not active_connections[self.client_ip]:
-                        del active_connections[self.client_ip]
-                    logger.debug(f"Connection closed: IP {self.client_ip}, Thread {thread_id}, Remaining connections for IP: {len(active_connections.get(self.client_ip, set()))}")
+            self.idle_keep_alive = False
+            logger.error(f"Unexpected error handling request: IP {self.client_ip}, Error: {e}", exc_info=True)
+    
+    def _next_request_buffered(self):
+        """True if bytes of another request are already read into rfile or waiting on the socket.
+        Checked without blocking; a parked connection must not leave data behind in rfile."""
+        try:
+            self.connection.setblocking(False)
+            try:
+                return bool(self.rfile.peek(1))
+            finally:
+                self.connection.settimeout(self.timeout)
+        except (BlockingIOError, InterruptedError):
+            return False
     
     def log_message(self, format, *args):
         """Override to suppress 404 errors for optional files and log to file"""
         # Suppress 404 errors for source maps and Chrome DevTools files (they're optional)
-        # log_message format: "code message" where code is like "404"
+        # Two-arg messages come from send_error -> log_error("code %d, message %s", code, message)
         if len(args) >= 2:
-            status_code = str(args[1])
-            path = str(args[0]) if args else ""
-            if status_code == "404" and ('.map' in path or '.well-known' in path or 'devtools' in path.lower()):
+            try:
+                status_code = int(args[0])
+            except (TypeError, ValueError):
+                status_code = 0
+            path = getattr(self, 'path', '')
+            if status_code == 404 and _OPTIONAL_FILE_RE.search(path):
                 return  # Don't log these 404s
             # Log to file with detailed information
             client_ip = self.client_address[0]
             # Update last activity timestamp
-            with connection_lock:
-                last_activity[client_ip] = time.time()
-            log_msg = f"HTTP {status_code} | {path} | Client: {client_ip}"
-            if status_code.startswith('4') or status_code.startswith('5'):
-                logger.warning(log_msg)
-            else:
-                logger.info(log_msg)
-            if file_handler:
-                file_handler.flush()
+            record_activity(client_ip)
+            logger.log(logging.WARNING if status_code >= 400 else logging.INFO,
+                       "HTTP %s | %s | Client: %s", status_code, path, client_ip)
         # Log all other messages normally
         super().log_message(format, *args)
     
@@ -212,16 +712,17 @@ class RianellHttpHandler(http.server.SimpleHTTPRequestHandler):
         method = self.command
         path = self.path
         user_agent = self.headers.get('User-Agent', 'Unknown')
-        referer = self.headers.get('Referer', 'None')
         
         # Update last activity timestamp
-        with connection_lock:
-            last_activity[client_ip] = time.time()
+        record_activity(client_ip)
+        
+        # An SSE stream already logs "SSE client connected"; skip the duplicate request line
+        if path == '/api/reload' and code == 200:
+            return
         
-        log_msg = f"REQUEST | {method} {path} | Status: {code} | Size: {size} | Client: {client_ip} | UA: {user_agent[:50]}"
-        logger.info(log_msg)
-        if file_handler:
-            file_handler.flush()
+        # Lazy %-formatting: the line is only built if a handler takes INFO (%.50s truncates the UA)
+        logger.info("REQUEST | %s %s | Status: %s | Size: %s | Client: %s | UA: %.50s",
+                    method, path, code, size, client_ip, user_agent)
     
     def log_error(self, format, *args):
         """Override to log errors to file"""
@@ -232,18 +733,14 @@ class RianellHttpHandler(http.server.SimpleHTTPRequestHandler):
             # These are normal when clients disconnect - only log at debug level
             client_ip = getattr(self, 'client_address', ['Unknown'])[0] if hasattr(self, 'client_address') else 'Unknown'
             path = getattr(self, 'path', 'Unknown')
-            logger.debug(f"Client disconnect (normal): {error_msg} | Client: {client_ip} | Path: {path}")
-            if file_handler:
-                file_handler.flush()
+            logger.debug("Client disconnect (normal): %s | Client: %s | Path: %s", error_msg, client_ip, path)
             return  # Don't call super().log_error() to suppress the exception traceback
         
         # Log other errors normally
         client_ip = getattr(self, 'client_address', ['Unknown'])[0] if hasattr(self, 'client_address') else 'Unknown'
         # self.path might not exist if request timed out before parsing
         path = getattr(self, 'path', 'Unknown')
-        logger.error(f"ERROR | {error_msg} | Client: {client_ip} | Path: {path}")
-        if file_handler:
-            file_handler.flush()
+        logger.error("ERROR | %s | Client: %s | Path: %s", error_msg, client_ip, path)
         super().log_error(format, *args)
 
     def _client_may_sensitive_api(self, client_ip):
@@ -260,68 +757,69 @@ class RianellHttpHandler(http.server.SimpleHTTPRequestHandler):
         ).strip()
         return supplied == secret
 
+    # Path -> handler method name for the exact-match API endpoints
+    _GET_ROUTES = {
+        '/api/reload': 'handle_sse_reload',                 # Server-Sent Events for auto-refresh
+        '/api/log': 'handle_client_log',                    # client-side logging
+        '/api/supabase-status': 'handle_supabase_status',
+        '/api/encryption-key': 'handle_encryption_key',     # client-server key sync
+    }
+    _POST_ROUTES = {
+        '/api/log': 'handle_client_log',
+        '/api/sync-log': 'handle_sync_log',
+        '/api/bug-report': 'handle_bug_report',
+    }
+    
     def do_GET(self):
         """Override to handle optional files gracefully and log client events"""
-        parsed_path = urlparse(self.path)
-        
-        # Handle Server-Sent Events endpoint for auto-refresh
-        if parsed_path.path == '/api/reload':
-            self.handle_sse_reload()
-            return
-        
-        # Handle client-side logging endpoint
-        if parsed_path.path == '/api/log':
-            self.handle_client_log()
-            return
-        
-        # Handle Supabase status endpoint
-        if parsed_path.path == '/api/supabase-status':
-            self.handle_supabase_status()
-            return
+        path = _request_path(self.path)
         
-        # Handle encryption key endpoint (for client-server key sync)
-        if parsed_path.path == '/api/encryption-key':
-            self.handle_encryption_key()
+        # Exact-match API endpoints: one dict lookup instead of a chain of comparisons
+        route = self._GET_ROUTES.get(path)
+        if route is not None:
+            getattr(self, route)()
             return
         
         # Handle anonymized training data endpoint
-        if parsed_path.path.startswith('/api/anonymized-data'):
+        if path.startswith('/api/anonymized-data'):
             self.handle_anonymized_data()
             return
         
         # Serve tutorial test page at /tutorial (same app, tutorial auto-opens for demo/testing)
-        if parsed_path.path.rstrip('/') == '/tutorial':
+        if path.rstrip('/') == '/tutorial':
             self.handle_tutorial_page()
             return
-        # Return 204 (No Content) for optional files instead of 404
-        optional_files = ['.map', '.well-known', 'devtools']
-        if any(opt in self.path.lower() for opt in optional_files):
-            self.send_response(204)  # No Content - file is optional
-            self.end_headers()
-            return
-        if self.try_gzip_static_get():
+        # Return 204 (No Content) for optional files instead of 404: a constant response
+        # written in one go, skipping send_response/end_headers and request logging
+        if _OPTIONAL_FILE_RE.search(self.path):
+            origin = self.headers.get('Origin', '')
+            cors = _cors_header_block(origin, config.PORT, self.headers.get('Host')) if origin else b''
+            self.wfile.write(_OPTIONAL_204_HEAD + self.date_time_string().encode('latin-1')
+                             + _OPTIONAL_204_SECURITY + cors + _OPTIONAL_204_TAIL)
             return
-        # Handle normal requests
-        super().do_GET()
+        # Static responses: on Linux, cork the socket so the header block and the start of the
+        # body (written or sendfile'd separately) leave in full segments; uncorking flushes.
+        corked = self._set_tcp_cork(True)
+        try:
+            if self.try_gzip_static_get():
+                return
+            # Handle normal requests
+            super().do_GET()
+        finally:
+            if corked:
+                self._set_tcp_cork(False)
     
     def do_POST(self):
         """Handle POST requests for client-side logging and Supabase"""
-        parsed_path = urlparse(self.path)
-        
-        if parsed_path.path == '/api/log':
-            self.handle_client_log()
-            return
-        
-        if parsed_path.path == '/api/sync-log':
-            self.handle_sync_log()
-            return
-
-        if parsed_path.path == '/api/bug-report':
-            self.handle_bug_report()
+        route = self._POST_ROUTES.get(_request_path(self.path))
+        if route is not None:
+            getattr(self, route)()
             return
         
         # For other POST requests, return 405 Method Not Allowed
         self.send_response(405)
+        self.send_header('Content-Length', '0')
+        self.send_header('Connection', 'close')  # request body is not read
         self.end_headers()
     
     def handle_tutorial_page(self):
@@ -362,50 +860,38 @@ class RianellHttpHandler(http.server.SimpleHTTPRequestHandler):
                 'available': SUPABASE_AVAILABLE
             }
             
-            # Try a simple query to verify connection
+            # Try a simple query to verify connection (recent successes are reused)
             if client:
-                try:
-                    test_response = client.table('anonymized_data').select('id').limit(1).execute()
+                ok, error = probe_supabase_connection(client)
+                if ok:
                     status['connection_test'] = 'success'
-                except Exception as e:
+                else:
                     status['connection_test'] = 'failed'
-                    status['error'] = str(e)[:100]
+                    status['error'] = error[:100]
             else:
                 status['connection_test'] = 'not_available'
             
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(status).encode('utf-8'))
+            self.send_json(200, status)
         except Exception as e:
             logger.error(f"Error handling supabase status: {e}")
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'error': str(e)}).encode('utf-8'))
+            self.send_json(500, {'error': str(e)})
     
     def handle_encryption_key(self):
         """Handle encryption key endpoint for client-server synchronization"""
         try:
             client_ip = self.client_address[0]
             if not http_security.sensitive_api_limiter.allow(client_ip):
-                self.send_response(429)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({'error': 'Too many requests'}).encode('utf-8'))
+                self.send_json(429, _TOO_MANY_REQUESTS_BODY)
                 return
             if not self._client_may_sensitive_api(client_ip):
-                self.send_response(403)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
                 detail = (
                     'Encryption key API is only reachable from loopback. Set HEALTH_APP_SENSITIVE_APIS_ON_LAN=1 to allow LAN clients '
                     '(see docs/SECURITY.md). If HEALTH_APP_SENSITIVE_APIS_LAN_SECRET is set, send header X-Rianell-LAN-Secret.'
                 )
-                self.wfile.write(json.dumps({
+                self.send_json(403, {
                     'error': 'Forbidden',
                     'detail': detail,
-                }).encode('utf-8'))
+                })
                 logger.warning(f"Blocked encryption-key request from non-loopback IP {client_ip}")
                 return
 
@@ -413,23 +899,16 @@ class RianellHttpHandler(http.server.SimpleHTTPRequestHandler):
             # Convert bytes back to hex string for transmission
             key_hex = key.hex()
             
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            
             response = {
                 'success': True,
                 'key': key_hex,
                 'algorithm': 'AES-256-GCM'
             }
-            self.wfile.write(json.dumps(response).encode('utf-8'))
+            self.send_json(200, response)
             logger.debug("Encryption key served to client")
         except Exception as e:
             logger.error(f"Error handling encryption key request: {e}", exc_info=True)
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'error': str(e)}).encode('utf-8'))
+            self.send_json(500, {'error': str(e)})
     
     def handle_sse_reload(self):
         """Handle Server-Sent Events for auto-refresh on file changes"""
@@ -440,6 +919,12 @@ class RianellHttpHandler(http.server.SimpleHTTPRequestHandler):
             self.send_header('Cache-Control', 'no-cache')
             self.send_header('Connection', 'keep-alive')
             self.send_header('X-Accel-Buffering', 'no')  # Disable buffering in nginx if present
+            # The stream has no length, so this connection is not reused for another request
+            self.close_connection = True
+            # The stream stays open as long as the tab does: run it outside the worker cap
+            detach = getattr(self.server, 'detach_worker', None)
+            if detach is not None:
+                detach()
             # CORS: handled in end_headers() (uses PORT from config)
             self.end_headers()
             
@@ -448,7 +933,7 @@ class RianellHttpHandler(http.server.SimpleHTTPRequestHandler):
             
             # Add client to list
             with sse_lock:
-                sse_clients.append((client_ip, self.wfile))
+                sse_clients[id(self.wfile)] = (client_ip, self.wfile)
                 logger.debug(f"SSE clients: {len(sse_clients)}")
             
             # Send initial connection message
@@ -459,24 +944,23 @@ class RianellHttpHandler(http.server.SimpleHTTPRequestHandler):
                 # Client disconnected - normal when page reloads
                 logger.debug(f"SSE client disconnected during initial connection: {client_ip}")
                 with sse_lock:
-                    sse_clients[:] = [(ip, w) for ip, w in sse_clients if w != self.wfile]
+                    sse_clients.pop(id(self.wfile), None)
                 return
             
             # Keep connection alive and wait for file change events
             while True:
                 try:
-                    # Wait for file change event (with short timeout to allow quick recovery)
-                    if file_change_event.wait(timeout=5):
+                    # Wait for file change event; on timeout send a keepalive to detect dead connections
+                    if file_change_event.wait(timeout=SSE_KEEPALIVE_INTERVAL):
                         # File changed - send reload message
-                        message = json.dumps({"type": "reload", "timestamp": time.time()})
-                        self.wfile.write(f'data: {message}\n\n'.encode('utf-8'))
+                        self.wfile.write(b'data: ' + _dumps_json({"type": "reload", "timestamp": time.time()}) + b'\n\n')
                         self.wfile.flush()
                         file_change_event.clear()
                         logger.info(f"Sent reload signal to SSE client: {client_ip}")
                     else:
-                        # Timeout - send keepalive ping to detect dead connections
-                        self.wfile.write(b': keepalive\n\n')
-                        self.wfile.flush()
+                        # Timeout - send keepalive ping straight to the socket (wfile is empty
+                        # after every flush above, so nothing can be reordered)
+                        self.connection.sendall(b': keepalive\n\n')
                 except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError, OSError) as e:
                     # Client disconnected - normal when page reloads or tab closes
                     error_code = getattr(e, 'winerror', None) or getattr(e, 'errno', None)
@@ -494,7 +978,7 @@ class RianellHttpHandler(http.server.SimpleHTTPRequestHandler):
         finally:
             # Remove client from list
             with sse_lock:
-                sse_clients[:] = [(ip, w) for ip, w in sse_clients if w != self.wfile]
+                sse_clients.pop(id(self.wfile), None)
             logger.debug(f"SSE client removed: {client_ip}, remaining: {len(sse_clients)}")
     
     def handle_client_log(self):
@@ -506,109 +990,84 @@ class RianellHttpHandler(http.server.SimpleHTTPRequestHandler):
             content_length = int(self.headers.get('Content-Length', 0))
             
             if content_length > MAX_CONTENT_LENGTH:
-                self.send_response(413)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({'error': 'Payload too large'}).encode('utf-8'))
+                # Body left unread: close rather than parse it as the next request
+                self.send_json(413, _PAYLOAD_TOO_LARGE_BODY, headers=(('Connection', 'close'),))
                 logger.warning(f"Request rejected: Content-Length {content_length} exceeds {MAX_CONTENT_LENGTH}")
                 return
             
             if content_length > 0:
                 if not http_security.client_log_limiter.allow(client_ip):
-                    self.send_response(429)
-                    self.send_header('Content-Type', 'application/json')
-                    self.end_headers()
-                    self.wfile.write(json.dumps({'error': 'Too many requests'}).encode('utf-8'))
+                    # Body left unread: close rather than parse it as the next request
+                    self.send_json(429, _TOO_MANY_REQUESTS_BODY, headers=(('Connection', 'close'),))
                     return
-                post_data = self.rfile.read(content_length)
+                post_data = _read_body_into_buffer(self.rfile, content_length)
                 try:
-                    log_data = json.loads(post_data.decode('utf-8'))
+                    log_data = _loads_json(post_data)
                 except (json.JSONDecodeError, UnicodeDecodeError) as e:
                     logger.warning(f"Invalid JSON in log request: {e}")
-                    self.send_response(400)
-                    self.send_header('Content-Type', 'application/json')
-                    self.end_headers()
-                    self.wfile.write(json.dumps({'error': 'Invalid JSON'}).encode('utf-8'))
+                    self.send_json(400, _INVALID_JSON_BODY)
                     return
                 
                 # Extract and validate log information
-                level = log_data.get('level', 'INFO').upper()
-                # Security: Validate level is one of allowed values
-                allowed_levels = ['INFO', 'WARN', 'WARNING', 'ERROR', 'DEBUG']
-                if level not in allowed_levels:
-                    level = 'INFO'
+                # Security: Validate level is one of allowed values; clients normally send it
+                # uppercase already, so upper() only runs on a miss
+                level = log_data.get('level', 'INFO')
+                log_level = _CLIENT_LOG_LEVELS.get(level)
+                if log_level is None:
+                    level = level.upper()
+                    log_level = _CLIENT_LOG_LEVELS.get(level)
+                    if log_level is None:
+                        level, log_level = 'INFO', logging.INFO
                 
-                message = log_data.get('message', '')
-                # Security: Limit message length and sanitize
-                message = message[:500] if len(message) > 500 else message
+                # Security: Limit message length and sanitize (a slice within bounds returns the
+                # string itself; replace() returns it unchanged when there is nothing to replace)
+                message = log_data.get('message', '')[:500]
                 message = message.replace('\n', ' ').replace('\r', '')  # Remove newlines
                 
-                timestamp = log_data.get('timestamp', datetime.now().isoformat())
-                # Security: Validate timestamp format (basic check)
-                if len(timestamp) > 50:
+                timestamp = log_data.get('timestamp')
+                # Security: Validate timestamp format (basic check); only read the clock when
+                # the client's timestamp is missing or rejected
+                if timestamp is None or len(timestamp) > 50:
                     timestamp = datetime.now().isoformat()
                 
-                source = log_data.get('source', 'client')
                 # Security: Limit source length
-                source = source[:20] if len(source) > 20 else source
+                source = log_data.get('source', 'client')[:20]
                 
                 details = log_data.get('details', {})
                 # Security: Limit details size (convert to string and check length)
+                details_str = None
                 if isinstance(details, dict):
-                    details_str = json.dumps(details)
+                    details_str = _dumps_json(details).decode('utf-8')
                     if len(details_str) > 1000:
                         details = {'error': 'Details too large'}
+                        details_str = None
                 else:
                     details = {}
                 
                 # Update last activity timestamp
-                with connection_lock:
-                    last_activity[client_ip] = time.time()
+                record_activity(client_ip)
                 
-                # Format log message
-                log_msg = f"CLIENT | {level} | {message}"
+                # Log based on level; %-style arguments, so the line is assembled on the log
+                # listener thread and the request thread only enqueues the record
                 if details:
-                    log_msg += f" | Details: {json.dumps(details)}"
-                log_msg += f" | IP: {client_ip} | Time: {timestamp}"
-                
-                # Log based on level
-                if level == 'ERROR':
-                    logger.error(log_msg)
-                elif level == 'WARN' or level == 'WARNING':
-                    logger.warning(log_msg)
-                elif level == 'DEBUG':
-                    logger.debug(log_msg)
+                    logger.log(log_level, "CLIENT | %s | %s | Details: %s | IP: %s | Time: %s", level, message,
+                               details_str or _dumps_json(details).decode('utf-8'), client_ip, timestamp)
                 else:
-                    logger.info(log_msg)
-                
-                if file_handler:
-                    file_handler.flush()
+                    logger.log(log_level, "CLIENT | %s | %s | IP: %s | Time: %s", level, message, client_ip, timestamp)
 
-                # Security: Validate and sanitize input
-                level = level[:10] if len(level) > 10 else level  # Limit length
-                message = message[:500] if len(message) > 500 else message  # Limit message length
-                
                 # Send success response (CORS + security headers via end_headers)
-                self.send_response(200)
-                self.send_header('Content-Type', 'application/json')
-                self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
-                self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-                self.send_header('X-Content-Type-Options', 'nosniff')
-                self.send_header('X-Frame-Options', 'DENY')
-                self.end_headers()
-                self.wfile.write(json.dumps({'status': 'logged'}).encode('utf-8'))
+                self.send_json(200, _CLIENT_LOG_OK_BODY, headers=(
+                    ('Access-Control-Allow-Methods', 'POST, OPTIONS'),
+                    ('Access-Control-Allow-Headers', 'Content-Type'),
+                    ('X-Content-Type-Options', 'nosniff'),
+                    ('X-Frame-Options', 'DENY'),
+                ))
             else:
                 # GET request to /api/log - return status
-                self.send_response(200)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({'status': 'logging_endpoint_active'}).encode('utf-8'))
+                self.send_json(200, _CLIENT_LOG_ACTIVE_BODY)
         except Exception as e:
             logger.error(f"Error handling client log: {e}")
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'error': str(e)}).encode('utf-8'))
+            self.send_json(500, {'error': str(e)})
     
     def handle_sync_log(self):
         """Handle sync event logging from client"""
@@ -618,10 +1077,8 @@ class RianellHttpHandler(http.server.SimpleHTTPRequestHandler):
             content_length = int(self.headers.get('Content-Length', 0))
             
             if content_length > MAX_CONTENT_LENGTH:
-                self.send_response(413)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({'error': 'Payload too large'}).encode('utf-8'))
+                # Body left unread: close rather than parse it as the next request
+                self.send_json(413, _PAYLOAD_TOO_LARGE_BODY, headers=(('Connection', 'close'),))
                 return
             
             if content_length > 0:
@@ -630,10 +1087,7 @@ class RianellHttpHandler(http.server.SimpleHTTPRequestHandler):
                     sync_data = json.loads(post_data.decode('utf-8'))
                 except (json.JSONDecodeError, UnicodeDecodeError) as e:
                     logger.warning(f"Invalid JSON in sync log request: {e}")
-                    self.send_response(400)
-                    self.send_header('Content-Type', 'application/json')
-                    self.end_headers()
-                    self.wfile.write(json.dumps({'error': 'Invalid JSON'}).encode('utf-8'))
+                    self.send_json(400, _INVALID_JSON_BODY)
                     return
                 
                 # Extract sync information (support both field names)
@@ -647,26 +1101,16 @@ class RianellHttpHandler(http.server.SimpleHTTPRequestHandler):
                 print(f"[SYNC] {records_synced} record(s) synced to Supabase anonymized_data for condition: {condition}")
                 
                 # Update last activity
-                with connection_lock:
-                    last_activity[client_ip] = time.time()
+                record_activity(client_ip)
                 
                 # Send success response
-                self.send_response(200)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({'status': 'logged'}).encode('utf-8'))
+                self.send_json(200, _CLIENT_LOG_OK_BODY)
             else:
                 # GET request to /api/sync-log - return status
-                self.send_response(200)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({'status': 'sync_logging_endpoint_active'}).encode('utf-8'))
+                self.send_json(200, _SYNC_LOG_ACTIVE_BODY)
         except Exception as e:
             logger.error(f"Error handling sync log: {e}")
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'error': str(e)}).encode('utf-8'))
+            self.send_json(500, {'error': str(e)})
 
     def handle_bug_report(self):
         """Handle bug report submissions and insert into Supabase."""
@@ -676,52 +1120,36 @@ class RianellHttpHandler(http.server.SimpleHTTPRequestHandler):
             content_length = int(self.headers.get('Content-Length', 0))
 
             if content_length <= 0:
-                self.send_response(400)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({'error': 'Empty request body'}).encode('utf-8'))
+                self.send_json(400, {'error': 'Empty request body'})
                 return
 
             if content_length > MAX_CONTENT_LENGTH:
-                self.send_response(413)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({'error': 'Payload too large'}).encode('utf-8'))
+                # Body left unread: close rather than parse it as the next request
+                self.send_json(413, _PAYLOAD_TOO_LARGE_BODY, headers=(('Connection', 'close'),))
                 return
 
             if not http_security.bug_report_limiter.allow(client_ip):
-                self.send_response(429)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({'error': 'Rate limit exceeded. Max 5 bug reports per day per IP.'}).encode('utf-8'))
+                # Body left unread: close rather than parse it as the next request
+                self.send_json(429, {'error': 'Rate limit exceeded. Max 5 bug reports per day per IP.'}, headers=(('Connection', 'close'),))
                 return
 
             post_data = self.rfile.read(content_length)
             try:
                 payload = json.loads(post_data.decode('utf-8'))
             except (json.JSONDecodeError, UnicodeDecodeError):
-                self.send_response(400)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({'error': 'Invalid JSON'}).encode('utf-8'))
+                self.send_json(400, _INVALID_JSON_BODY)
                 return
 
             description = str(payload.get('description', '')).strip()
             if not description:
-                self.send_response(400)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({'error': 'description is required'}).encode('utf-8'))
+                self.send_json(400, {'error': 'description is required'})
                 return
 
             global SUPABASE_AVAILABLE
             SUPABASE_AVAILABLE = check_supabase_availability()
             client = get_supabase_service_client() or init_supabase_client()
             if not SUPABASE_AVAILABLE or not client:
-                self.send_response(503)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({'error': 'Supabase not available'}).encode('utf-8'))
+                self.send_json(503, {'error': 'Supabase not available'})
                 return
 
             report_row = {
@@ -740,39 +1168,27 @@ class RianellHttpHandler(http.server.SimpleHTTPRequestHandler):
             client.table('bug_reports').insert(report_row).execute()
 
             logger.info(f"BUG_REPORT | Received from {client_ip} | title={report_row['title'] or ''}")
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'success': True}).encode('utf-8'))
+            self.send_json(200, {'success': True})
         except Exception as e:
             logger.error(f"Error handling bug report: {e}", exc_info=True)
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'error': 'Failed to submit bug report'}).encode('utf-8'))
+            self.send_json(500, {'error': 'Failed to submit bug report'})
     
     def handle_anonymized_data(self):
         """Handle fetching decrypted anonymized training data"""
         try:
             client_ip = self.client_address[0]
             if not http_security.sensitive_api_limiter.allow(client_ip):
-                self.send_response(429)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({'error': 'Too many requests'}).encode('utf-8'))
+                self.send_json(429, _TOO_MANY_REQUESTS_BODY)
                 return
             if not self._client_may_sensitive_api(client_ip):
-                self.send_response(403)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
                 detail = (
                     'anonymized-data API is only reachable from loopback. Set HEALTH_APP_SENSITIVE_APIS_ON_LAN=1 for LAN '
                     '(see docs/SECURITY.md). If HEALTH_APP_SENSITIVE_APIS_LAN_SECRET is set, send header X-Rianell-LAN-Secret.'
                 )
-                self.wfile.write(json.dumps({
+                self.send_json(403, {
                     'error': 'Forbidden',
                     'detail': detail,
-                }).encode('utf-8'))
+                })
                 logger.warning(f"Blocked anonymized-data request from non-loopback IP {client_ip}")
                 return
 
@@ -786,10 +1202,7 @@ class RianellHttpHandler(http.server.SimpleHTTPRequestHandler):
             
             # Security: Validate condition parameter length
             if condition and len(condition) > 200:
-                self.send_response(400)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({'error': 'Condition parameter too long'}).encode('utf-8'))
+                self.send_json(400, {'error': 'Condition parameter too long'})
                 return
             
             # Get limit parameter (default 1000)
@@ -803,10 +1216,7 @@ class RianellHttpHandler(http.server.SimpleHTTPRequestHandler):
             global SUPABASE_AVAILABLE
             SUPABASE_AVAILABLE = check_supabase_availability()
             if not SUPABASE_AVAILABLE:
-                self.send_response(503)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({'error': 'Supabase not available'}).encode('utf-8'))
+                self.send_json(503, {'error': 'Supabase not available'})
                 return
             
             # Fetch and decrypt anonymized data
@@ -820,33 +1230,25 @@ class RianellHttpHandler(http.server.SimpleHTTPRequestHandler):
                     if isinstance(log_data, dict):
                         training_data.append(log_data)
             
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            
             response = {
                 'success': True,
                 'condition': condition,
                 'count': len(training_data),
                 'data': training_data
             }
-            self.wfile.write(json.dumps(response).encode('utf-8'))
+            self.send_json(200, response)
             logger.info(f"Anonymized training data fetched: condition={condition}, records={len(training_data)}")
         
         except Exception as e:
             logger.error(f"Error handling anonymized data request: {e}", exc_info=True)
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'error': str(e)}).encode('utf-8'))
+            self.send_json(500, {'error': str(e)})
     
     def try_gzip_static_get(self):
         """Serve text-like static files with gzip when the compressed body is smaller."""
         enc = self.headers.get('Accept-Encoding', '')
         if 'gzip' not in enc or self.command not in ('GET', 'HEAD'):
             return False
-        parsed_path = urlparse(self.path)
-        path_only = parsed_path.path
+        path_only = _request_path(self.path)
         if path_only.startswith('/api/'):
             return False
         ext = Path(path_only).suffix.lower()
@@ -854,19 +1256,13 @@ class RianellHttpHandler(http.server.SimpleHTTPRequestHandler):
             return False
         try:
             fs_path = self.translate_path(self.path)
+            st = os.stat(fs_path)
         except Exception:
             return False
-        if not os.path.isfile(fs_path):
-            return False
-        try:
-            with open(fs_path, 'rb') as f:
-                data = f.read()
-        except OSError:
-            return False
-        if len(data) < 1024:
+        if not stat.S_ISREG(st.st_mode) or st.st_size < 1024:
             return False
-        gz = gzip.compress(data, compresslevel=6)
-        if len(gz) >= len(data) - 50:
+        gz = _cached_gzip_body(fs_path, st)
+        if gz is None:
             return False
         ctype = self.guess_type(path_only)
         self.send_response(200)
@@ -880,88 +1276,123 @@ class RianellHttpHandler(http.server.SimpleHTTPRequestHandler):
             self.wfile.write(gz)
         return True
     
+    def send_head(self):
+        """Serve small regular files from the in-memory static cache.
+
+        Directories, trailing-slash paths, missing and large files go through
+        SimpleHTTPRequestHandler.send_head unchanged.
+        """
+        path = self.translate_path(self.path)
+        if path.endswith('/'):
+            return super().send_head()
+        try:
+            st = os.stat(path)
+        except OSError:
+            return super().send_head()
+        if not stat.S_ISREG(st.st_mode) or st.st_size > STATIC_CACHE_MAX_FILE:
+            return super().send_head()
+        body = _cached_static_body(path, st)
+        if body is None:
+            return super().send_head()
+        # Conditional GET, as in the stdlib send_head
+        if 'If-Modified-Since' in self.headers and 'If-None-Match' not in self.headers:
+            try:
+                ims = email.utils.parsedate_to_datetime(self.headers['If-Modified-Since'])
+            except (TypeError, IndexError, OverflowError, ValueError):
+                pass
+            else:
+                if ims.tzinfo is None:
+                    ims = ims.replace(tzinfo=timezone.utc)
+                if ims.tzinfo is timezone.utc and int(st.st_mtime) <= ims.timestamp():
+                    self.send_response(304)
+                    self.end_headers()
+                    return None
+        self.send_response(200)
+        self.send_header('Content-type', self.guess_type(path))
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Last-Modified', self.date_time_string(st.st_mtime))
+        self.end_headers()
+        return io.BytesIO(body)
+    
+    def send_json(self, code, payload, headers=()):
+        """Send a complete JSON response with its Content-Length (needed for keep-alive).
+
+        payload may be pre-encoded bytes (constant bodies) or an object to serialize.
+        """
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _set_tcp_cork(self, on):
+        """Set TCP_CORK where the platform has it (Linux). Returns True if the option was set."""
+        if not hasattr(socket, 'TCP_CORK'):
+            return False
+        try:
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, 1 if on else 0)
+        except OSError:
+            return False
+        return True
+    
+    def copyfile(self, source, outputfile):
+        """Send static file bodies with os.sendfile where the platform has it.
+
+        Otherwise (Windows, in-memory sources such as directory listings, or a wrapped
+        output stream) copy in send_buffer_size chunks rather than shutil's 64 KB default;
+        socket.sendfile's own fallback would use 8 KB sends.
+        """
+        if outputfile is self.wfile and hasattr(os, 'sendfile'):
+            try:
+                source.fileno()
+            except (AttributeError, OSError, io.UnsupportedOperation):
+                pass
+            else:
+                self.wfile.flush()  # buffered headers must go out before the sendfile'd body
+                self.connection.sendfile(source)
+                return
+        shutil.copyfileobj(source, outputfile, self.send_buffer_size)
+    
     def do_OPTIONS(self):
         """Handle CORS preflight requests"""
         self.send_response(200)
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization, apikey, Prefer')
+        self.send_header('Content-Length', '0')
         self.end_headers()
     
     def end_headers(self):
+        # HTTP/0.9 responses carry no headers (same check as send_header)
+        if self.request_version == 'HTTP/0.9':
+            super().end_headers()
+            return
         # Security: Add security headers to all responses
-        self.send_header('X-Content-Type-Options', 'nosniff')
-        self.send_header('X-Frame-Options', 'DENY')
-        self.send_header('X-XSS-Protection', '1; mode=block')
-        self.send_header('Referrer-Policy', 'strict-origin-when-cross-origin')
-        
-        # Permissions-Policy: Restrict browser features for security
-        # Note: Removed 'ambient-light-sensor' and 'document-domain' as they are not recognized features
-        permissions_policy = (
-            'accelerometer=(), '
-            'autoplay=(), '
-            'camera=(), '
-            'display-capture=(), '
-            'encrypted-media=(), '
-            'fullscreen=(self), '
-            'geolocation=(), '
-            'gyroscope=(), '
-            'magnetometer=(), '
-            'microphone=(), '
-            'midi=(), '
-            'payment=(), '
-            'picture-in-picture=(), '
-            'publickey-credentials-get=(self), '
-            'screen-wake-lock=(), '
-            'sync-xhr=(), '
-            'usb=(), '
-            'web-share=(self), '
-            'xr-spatial-tracking=()'
-        )
-        self.send_header('Permissions-Policy', permissions_policy)
+        self._headers_buffer.append(_SECURITY_HEADERS)
         
         # CORS: echo allowed dev origins for this server PORT (see http_security.cors_allow_origin_value)
         origin = self.headers.get('Origin', '')
-        cval = http_security.cors_allow_origin_value(
-            origin if origin else None,
-            config.PORT,
-            self.headers.get('Host'),
-        )
-        if cval is not None:
-            self.send_header('Access-Control-Allow-Origin', cval)
+        if origin:
+            self._headers_buffer.append(_cors_header_block(origin, config.PORT, self.headers.get('Host')))
         
         # Cache Transformers.js file aggressively (it's a large library)
         if getattr(self, '_static_long_cache', False):
-            self.send_header('Cache-Control', 'public, max-age=86400, must-revalidate')
+            cache_headers = _CACHE_REVALIDATE_HEADERS
             self._static_long_cache = False
         elif self.path.endswith('transformers.js'):
-            self.send_header('Cache-Control', 'public, max-age=31536000, immutable')
-            self.send_header('Pragma', 'public')
+            cache_headers = _CACHE_IMMUTABLE_HEADERS
         else:
-            parsed = urlparse(self.path)
-            p = parsed.path.split('?')[0].lower()
+            p = _request_path(self.path).lower()
             if p.endswith(('.js', '.css', '.png', '.svg', '.ico', '.webp', '.woff', '.woff2', '.json')) and not p.endswith('index.html'):
-                self.send_header('Cache-Control', 'public, max-age=86400, must-revalidate')
+                cache_headers = _CACHE_REVALIDATE_HEADERS
             else:
-                self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
-                self.send_header('Pragma', 'no-cache')
-                self.send_header('Expires', '0')
+                cache_headers = _NO_CACHE_HEADERS
+        self._headers_buffer.append(cache_headers)
         
         super().end_headers()
     
-    def guess_type(self, path):
-        """Override to set correct MIME types"""
-        # Ensure JavaScript files are served with correct MIME type
-        if path.endswith('.js'):
-            return 'application/javascript'
-        if path.endswith('.json'):
-            return 'application/json'
-        if path.endswith('.css'):
-            return 'text/css'
-        if path.endswith('.html'):
-            return 'text/html'
-        
-        # For other files, use parent's guess_type
-        return super().guess_type(path)
 
 def notify_sse_clients():
     """Notify all SSE clients to reload by waking their handler threads.
@@ -1038,19 +1469,50 @@ if WATCHDOG_AVAILABLE:
     class FileChangeHandler(FileSystemEventHandler):
         """Handler for file system events"""
         
+        # An isolated change notifies at once; changes within NOTIFY_COALESCE_WINDOW of the last
+        # notification (a save touching several files, a git pull) share one trailing
+        # notification at the end of that window, at least NOTIFY_TRAILING_DELAY after the first
+        NOTIFY_COALESCE_WINDOW = 0.5
+        NOTIFY_TRAILING_DELAY = 0.1
+        
         def __init__(self):
             super().__init__()
             self.last_modified = {}
+            self._notify_lock = threading.Lock()
+            self._notify_timer = None
+            self._last_notify = float('-inf')
             # Files/directories to ignore
             self.ignore_patterns = [
                 '.git', '__pycache__', '.pyc', '.log', 'logs',
                 '.DS_Store', 'Thumbs.db', '.swp', '.tmp'
             ]
+            # All patterns as one case-insensitive alternation: a single scan per event
+            self._ignore_re = re.compile('|'.join(map(re.escape, self.ignore_patterns)), re.IGNORECASE)
         
         def should_ignore(self, path):
             """Check if path should be ignored"""
-            path_str = str(path).lower()
-            return any(pattern.lower() in path_str for pattern in self.ignore_patterns)
+            return self._ignore_re.search(str(path)) is not None
+        
+        def _schedule_notify(self):
+            """Notify SSE clients now, or fold this change into a pending trailing notification"""
+            with self._notify_lock:
+                now = time.monotonic()
+                notify_now = self._notify_timer is None and now - self._last_notify >= self.NOTIFY_COALESCE_WINDOW
+                if notify_now:
+                    self._last_notify = now
+                elif self._notify_timer is None:
+                    delay = max(self.NOTIFY_TRAILING_DELAY, self._last_notify + self.NOTIFY_COALESCE_WINDOW - now)
+                    self._notify_timer = threading.Timer(delay, self._trailing_notify)
+                    self._notify_timer.daemon = True
+                    self._notify_timer.start()
+            if notify_now:
+                notify_sse_clients()
+        
+        def _trailing_notify(self):
+            with self._notify_lock:
+                self._notify_timer = None
+                self._last_notify = time.monotonic()
+            notify_sse_clients()
         
         def on_modified(self, event):
             """Called when a file or directory is modified"""
@@ -1061,7 +1523,7 @@ if WATCHDOG_AVAILABLE:
                 return
             
             # Only watch relevant file types
-            if not any(event.src_path.endswith(ext) for ext in ['.html', '.js', '.css', '.json', '.py']):
+            if not event.src_path.endswith(('.html', '.js', '.css', '.json', '.py')):
                 return
             
             # Debounce rapid changes (same file modified multiple times)
@@ -1074,50 +1536,59 @@ if WATCHDOG_AVAILABLE:
             
             logger.info(f"File changed: {event.src_path}")
             logger.info("Notifying all connected clients to reload...")
-            notify_sse_clients()
+            self._schedule_notify()
         
         def on_created(self, event):
             """Called when a file or directory is created"""
             if event.is_directory or self.should_ignore(event.src_path):
                 return
             logger.info(f"File created: {event.src_path}")
-            notify_sse_clients()
+            self._schedule_notify()
         
         def on_deleted(self, event):
             """Called when a file or directory is deleted"""
             if event.is_directory or self.should_ignore(event.src_path):
                 return
             logger.info(f"File deleted: {event.src_path}")
-            notify_sse_clients()
+            self._schedule_notify()
 else:
     # Dummy class when watchdog is not available
     class FileChangeHandler:
         """Dummy handler when watchdog is not available"""
         pass
 
+# Set on shutdown so the cleanup thread wakes immediately instead of sleeping out its interval
+_cleanup_stop = threading.Event()
+
 def cleanup_inactive_connections():
     """Periodically clean up inactive connections"""
     while True:
         try:
-            time.sleep(CLEANUP_INTERVAL)
+            if _cleanup_stop.wait(CLEANUP_INTERVAL):
+                return
             current_time = time.time()
             inactive_ips = []
             
-            with connection_lock:
-                for ip, last_time in list(last_activity.items()):
-                    if current_time - last_time > CONNECTION_TIMEOUT:
-                        inactive_ips.append(ip)
-                        # Clean up inactive IPs
-                        if ip in active_connections:
-                            connection_count = len(active_connections[ip])
-                            if connection_count > 0:
-                                logger.info(f"Cleaning up inactive connections for IP {ip} ({connection_count} connections inactive for {int(current_time - last_time)}s)")
-                            del active_connections[ip]
-                        if ip in last_activity:
-                            del last_activity[ip]
-                
-                if inactive_ips:
-                    logger.info(f"Cleaned up {len(inactive_ips)} inactive IP(s)")
+            # One shard at a time, so requests on other shards are never blocked; each shard
+            # only pops IPs whose expiry deadline has passed instead of scanning every IP
+            for shard in connection_shards:
+                with shard.lock:
+                    expired = shard.pop_expired(current_time)
+                for ip, idle, connection_count in expired:
+                    inactive_ips.append(ip)
+                    if connection_count > 0:
+                        logger.info(f"Cleaning up inactive connections for IP {ip} ({connection_count} connections inactive for {int(idle)}s)")
+            
+            rejected = 0
+            for shard in connection_shards:
+                with shard.lock:
+                    rejected += shard.rejected_connections
+                    shard.rejected_connections = 0
+            
+            if inactive_ips:
+                logger.info(f"Cleaned up {len(inactive_ips)} inactive IP(s)")
+            if rejected:
+                logger.warning(f"Rejected {rejected} connection(s) over the per-IP limit of {MAX_CONNECTIONS_PER_IP} in the last {CLEANUP_INTERVAL}s")
         except Exception as e:
             logger.error(f"Error in cleanup thread: {e}", exc_info=True)
 
@@ -1148,6 +1619,7 @@ def start_server_thread():
         try:
             logger.info("Shutting down existing server...")
             server_instance.shutdown()
+            server_instance.server_close()  # frees the port, parked connections and idle workers
             if server_thread and server_thread.is_alive():
                 server_thread.join(timeout=2)
             server_instance = None
@@ -1576,18 +2048,28 @@ def create_server_dashboard():
                     logger.warning(f"Service-key delete failed, falling back to client-side deletes: {e}")
                     # Fall through to client-side deletion below
 
-            # If service-key path not used or failed, fall back to fetching IDs and deleting one-by-one
+            # If service-key path not used or failed, fall back to fetching IDs and deleting them
+            # in id IN (...) chunks; only a chunk that fails is retried one id at a time.
             if not service_delete_ok:
                 all_records = client.table('anonymized_data').select('id').execute()
                 if all_records and all_records.data:
                     record_count = len(all_records.data)
                     logger.info(f"Found {record_count} records to delete (client-side)")
-                    for record in all_records.data:
+                    ids = [record['id'] for record in all_records.data]
+                    for i in range(0, len(ids), 100):
+                        chunk = ids[i:i + 100]
                         try:
-                            client.table('anonymized_data').delete().eq('id', record['id']).execute()
-                            deleted += 1
+                            client.table('anonymized_data').delete().in_('id', chunk).execute()
+                            deleted += len(chunk)
+                            continue
                         except Exception as e:
-                            logger.warning(f"Failed to delete record {record.get('id')}: {e}")
+                            logger.warning(f"Batch delete failed, retrying {len(chunk)} records individually: {e}")
+                        for record_id in chunk:
+                            try:
+                                client.table('anonymized_data').delete().eq('id', record_id).execute()
+                                deleted += 1
+                            except Exception as e:
+                                logger.warning(f"Failed to delete record {record_id}: {e}")
                     logger.info(f"Successfully deleted {deleted}/{record_count} records")
                 else:
                     logger.info("Database already empty")
@@ -1738,7 +2220,7 @@ def create_server_dashboard():
         # Ask for parameters
         dialog = tk.Toplevel(root)
         dialog.title("Generate CSV Sample Data")
-        dialog.geometry("400x200")
+        dialog.geometry("400x260")
         dialog.configure(bg='#1e1e1e')
         dialog.transient(root)
         dialog.grab_set()
@@ -1752,11 +2234,17 @@ def create_server_dashboard():
         weight_var = tk.StringVar(value="75.0")
         weight_entry = ttk.Entry(dialog, textvariable=weight_var, width=20)
         weight_entry.pack(pady=5)
+
+        ttk.Label(dialog, text="Format (JSON imports faster):", background='#1e1e1e', foreground='#e0f2f1').pack(pady=5)
+        format_var = tk.StringVar(value="csv")
+        format_combo = ttk.Combobox(dialog, textvariable=format_var, values=sample_data.OUTPUT_FORMATS, state='readonly', width=17)
+        format_combo.pack(pady=5)
     
         def do_generate_csv():
             try:
                 num_days = int(days_var.get())
                 weight = float(weight_var.get())
+                output_format = format_var.get()
                 
                 if num_days <= 0 or num_days > 3650:
                     messagebox.showerror("Error", "Number of days must be between 1 and 3650")
@@ -1780,8 +2268,8 @@ def create_server_dashboard():
                                 pass
                         
                         root.after(0, lambda: safe_update_progress("Generating data..."))
-                        output_path = config.PROJECT_ROOT / f'health_data_sample_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-                        result = generate_sample_csv_data(num_days, weight, output_path)
+                        output_path = config.PROJECT_ROOT / f'health_data_sample_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{output_format}'
+                        result = generate_sample_csv_data(num_days, weight, output_path, output_format)
                         if result:
                             root.after(0, lambda: safe_update_progress(f"Complete! Saved to:\n{Path(result).name}"))
                             logger.info(f"CSV generated: {result}")
@@ -2182,12 +2670,18 @@ def create_server_dashboard():
     # Initial viewer refresh
     refresh_db_viewer()
     
+    def _stop_logging():
+        # os._exit skips atexit, so drain queued records to the log file here
+        if config.log_listener is not None:
+            config.log_listener.stop()
+    
     # Handle window close - terminate server
     def on_closing():
         """Handle window close event - shutdown server and exit"""
         logger.info("Dashboard window closed - shutting down server...")
         try:
             # Shutdown the server
+            _cleanup_stop.set()
             with server_lock:
                 if server_instance:
                     logger.info("Shutting down HTTP server...")
@@ -2200,11 +2694,13 @@ def create_server_dashboard():
             
             # Exit the process
             logger.info("Server terminated by user")
+            _stop_logging()
             os._exit(0)  # Force exit all threads
         
         except Exception as e:
             logger.error(f"Error during shutdown: {e}", exc_info=True)
             root.destroy()
+            _stop_logging()
             os._exit(0)
     
     root.protocol("WM_DELETE_WINDOW", on_closing)
@@ -2386,7 +2882,7 @@ def main():
         
         # Close all SSE connections
         with sse_lock:
-            for client_ip, wfile in sse_clients:
+            for client_ip, wfile in sse_clients.values():
                 try:
                     wfile.close()
                 except:
@@ -2394,6 +2890,7 @@ def main():
             sse_clients.clear()
         
         # Shutdown server
+        _cleanup_stop.set()
         if server_instance:
             server_instance.shutdown()
         logger.info("Server shutdown complete")
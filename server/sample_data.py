@@ -1,214 +1,404 @@
 """
-Sample data generation: CSV and seasonal/weekly helpers.
+Sample data generation: the shared day-by-day generator, CSV/JSON writers and seasonal/weekly helpers.
 """
+import os
 import json
+from json.encoder import encode_basestring_ascii
 import random
 import csv
-from datetime import datetime, timedelta
+from array import array
+from bisect import bisect
+from functools import lru_cache
+from itertools import accumulate, repeat, starmap
+from datetime import date, datetime, timedelta
 from pathlib import Path
 
 from . import config
 
 
+CSV_HEADERS = (
+    'Date', 'BPM', 'Weight', 'Fatigue', 'Stiffness', 'Back Pain',
+    'Sleep', 'Joint Pain', 'Mobility', 'Daily Function', 'Swelling',
+    'Flare', 'Mood', 'Irritability', 'Weather Sensitivity', 'Steps', 'Hydration',
+    'Energy Clarity', 'Stressors', 'Symptoms', 'Pain Location', 'Food', 'Exercise', 'Notes'
+)
+
+# App log keys for each CSV column (same shape the web app exports and imports as JSON).
+JSON_LOG_KEYS = (
+    'date', 'bpm', 'weight', 'fatigue', 'stiffness', 'backPain',
+    'sleep', 'jointPain', 'mobility', 'dailyFunction', 'swelling',
+    'flare', 'mood', 'irritability', 'weatherSensitivity', 'steps', 'hydration',
+    'energyClarity', 'stressors', 'symptoms', 'painLocation', 'food', 'exercise', 'notes'
+)
+OUTPUT_FORMATS = ('csv', 'json')
+# '"key":' text per JSON_LOG_KEYS entry, and which fields already hold JSON text.
+_JSON_FIELD_PREFIXES = tuple(json.dumps(key) + ':' for key in JSON_LOG_KEYS)
+_JSON_RAW_FIELDS = tuple(key in ('food', 'exercise') for key in JSON_LOG_KEYS)
+
+HEALTHY_FOODS = (
+    {'name': 'Grilled chicken, 200g', 'calories': 330, 'protein': 62},
+    {'name': 'Brown rice, 150g', 'calories': 165, 'protein': 3.5},
+    {'name': 'Steamed vegetables', 'calories': 50, 'protein': 2},
+    {'name': 'Salmon fillet, 180g', 'calories': 360, 'protein': 50},
+    {'name': 'Quinoa salad', 'calories': 220, 'protein': 8},
+    {'name': 'Greek yogurt, 150g', 'calories': 130, 'protein': 11},
+    {'name': 'Oatmeal with berries', 'calories': 200, 'protein': 5},
+    {'name': 'Mixed nuts, 30g', 'calories': 180, 'protein': 5},
+    {'name': 'Eggs, 2 large', 'calories': 140, 'protein': 12},
+    {'name': 'Grilled fish, 200g', 'calories': 280, 'protein': 45},
+)
+COMFORT_FOODS = (
+    {'name': 'Pizza slice', 'calories': 280, 'protein': 12},
+    {'name': 'Pasta, 200g', 'calories': 250, 'protein': 8},
+    {'name': 'Bread, 2 slices', 'calories': 160, 'protein': 6},
+    {'name': 'Chocolate bar', 'calories': 220, 'protein': 3},
+)
+FLARE_FOODS = HEALTHY_FOODS + COMFORT_FOODS
+EXERCISE_TEMPLATES = (
+    'Walking, 30 minutes', 'Yoga, 20 minutes', 'Swimming, 25 minutes',
+    'Cycling, 40 minutes', 'Stretching, 15 minutes', 'Light jogging, 20 minutes',
+    'Pilates, 30 minutes', 'Tai Chi, 25 minutes', 'Water aerobics, 30 minutes',
+    'Physical therapy exercises, 20 minutes', 'Gentle strength training, 15 minutes',
+    'Balance exercises, 10 minutes',
+)
+# json.dumps(food_item) up to the calories value, per template name; the rest of each item
+# ({calories}, "protein": {protein}}) is formatted per day, byte-identical to json.dumps.
+_FOOD_JSON_PREFIXES = {
+    template['name']: '{"name": ' + json.dumps(template['name']) + ', "calories": '
+    for template in FLARE_FOODS
+}
+ENERGY_CLARITY_OPTIONS = (
+    "High Energy", "Moderate Energy", "Low Energy", "Mental Clarity", "Brain Fog",
+    "Good Concentration", "Poor Concentration", "Mental Fatigue", "Focused", "Distracted",
+)
+HIGH_ENERGY_CLARITY = ("High Energy", "Mental Clarity", "Good Concentration")
+LOW_ENERGY_CLARITY = ("Low Energy", "Brain Fog", "Mental Fatigue")
+NOTES_OPTIONS = (
+    "Feeling better today", "Morning stiffness was manageable",
+    "Had a good night's sleep", "Some joint pain in the morning",
+    "Feeling tired", "Good day overall", "Minor flare symptoms",
+    "Exercised today, feeling good",
+)
+# Relative frequency of each NOTES_OPTIONS entry on days without a more specific note:
+# everyday remarks dominate, flare-like remarks on non-flare days are rare.
+NOTES_WEIGHTS = (4, 3, 3, 2, 3, 4, 1, 2)
+NOTES_CHANCE = 0.12
+_NOTES_CUM_WEIGHTS = tuple(accumulate(NOTES_WEIGHTS))
+
+# Fixed uniforms consumed per generated day (flare roll, flare length, 10 symptom noises,
+# BPM, weight, exercise, food, steps, hydration, energy/clarity and notes).
+_DAILY_DRAWS = 20
+
+# Output files are written through a 1 MiB buffer: a 10-year CSV is ~0.7 MB, so it goes out
+# in one or two write() calls instead of one per default 8 KiB block.
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+# Days of per-day inputs (uniforms, dates, flare schedule) precomputed at once; a
+# 90-day default run is a single chunk, longer runs never hold more than this many days.
+SAMPLE_CHUNK_DAYS = 1024
+
+# Seasonal factor by 0-based month (winter worse, summer better) and day-of-week pattern by
+# weekday (weekends better); indexed directly instead of branching per day.
+SEASONAL_FACTORS = (-0.3, -0.3, 0, 0, 0, 0.2, 0.2, 0.2, 0, 0, 0, -0.3)
+WEEKLY_PATTERNS = (-0.1, -0.1, -0.1, -0.1, -0.1, 0.15, 0.15)
+
+# Flare-day symptom scores as (offset from baseline health, noise spread), in the order
+# fatigue, stiffness, back pain, joint pain, sleep, mobility, daily function, swelling,
+# mood, irritability - the same order as the ten symptom noises in each day's draws.
+FLARE_SCORE_RANGES = (
+    (-3, 3), (-2.5, 3), (-2, 3), (-2.5, 2.5), (-4, 2),
+    (-4, 2), (-3.5, 2.5), (-3, 2.5), (-3.5, 2), (-2, 3),
+)
+
+
 def get_seasonal_factor(month):
     """Calculate seasonal factor (winter worse, summer better)."""
-    if month == 11 or month == 0 or month == 1:
-        return -0.3
-    if 2 <= month <= 4:
-        return 0
-    if 5 <= month <= 7:
-        return 0.2
-    return 0
+    return SEASONAL_FACTORS[month]
 
 
 def get_weekly_pattern(day_of_week):
     """Calculate day of week pattern (weekends better)."""
-    if day_of_week in (5, 6):
-        return 0.15
-    return -0.1
+    return WEEKLY_PATTERNS[day_of_week]
+
+
+@lru_cache(maxsize=None)
+def dump_exercise_items(exercise_items):
+    """json.dumps of an exercise tuple; at most 1-2 of EXERCISE_TEMPLATES, so a small finite set."""
+    return json.dumps(list(exercise_items))
+
+
+def clamp_score(value):
+    """Round to the nearest whole score and clamp it to the 1-10 symptom scale."""
+    value = round(value)
+    # Conditional instead of max(1, min(10, ...)): this runs ~11 times per generated day.
+    return 1 if value < 1 else 10 if value > 10 else value
+
+
+def build_date_columns(start_date, num_days):
+    """
+    ISO date strings, 0-based months and weekdays for num_days consecutive days.
+    Days are walked by ordinal and formatted with isoformat() rather than strftime();
+    weekdays come straight from the ordinal (day 1 was a Monday).
+    """
+    first = start_date.toordinal()
+    ordinals = range(first, first + num_days)
+    days = [date.fromordinal(ordinal) for ordinal in ordinals]
+    return (
+        [day.isoformat() for day in days],
+        [day.month - 1 for day in days],
+        [(ordinal + 6) % 7 for ordinal in ordinals],
+    )
+
+
+def build_flare_schedule(flare_rolls, duration_rolls, flare_chances, state=(False, 0, 0)):
+    """
+    Run the flare/recovery state machine over pre-drawn uniforms.
+    A flare starts when the day's roll is below its chance and lasts 2-5 days (from the
+    day's duration roll). state is (flare_state, flare_duration, recovery_phase) carried in
+    from earlier days. Returns (flare flags, recovery phase) lists, one entry per day, and
+    the state after the last day.
+    """
+    flare_flags = []
+    recovery_phases = []
+    flare_state, flare_duration, recovery_phase = state
+    for roll, duration_roll, chance in zip(flare_rolls, duration_rolls, flare_chances):
+        if flare_duration > 0:
+            flare_duration -= 1
+            if flare_duration == 0:
+                flare_state = False
+                recovery_phase = 1
+        elif roll < chance:
+            flare_state = True
+            flare_duration = 2 + int(duration_roll * 4)
+        else:
+            recovery_phase += 1
+        flare_flags.append(flare_state)
+        recovery_phases.append(recovery_phase)
+    return flare_flags, recovery_phases, (flare_state, flare_duration, recovery_phase)
+
+
+def iter_day_inputs(num_days, start_date, rng):
+    """
+    Yield the precomputed inputs for each day: (date_str, weekly pattern, seasonal factor,
+    flare flag, recovery phase, baseline health, the day's _DAILY_DRAWS uniforms).
+    Columns are built SAMPLE_CHUNK_DAYS at a time, so memory stays bounded for any num_days.
+    """
+    rand = rng.random
+    flare_carry = (False, 0, 0)
+    for chunk_start in range(0, num_days, SAMPLE_CHUNK_DAYS):
+        chunk_days = min(SAMPLE_CHUNK_DAYS, num_days - chunk_start)
+        # Draw every fixed per-day uniform for the chunk in one batch, kept in a fixed-width
+        # array('d') (8 bytes per draw, no float objects); variable-count draws
+        # (food/exercise picks and jitter) still come from rng on demand.
+        # starmap over an empty-args repeat calls rand() from C, with no generator frame per draw.
+        uniforms = array('d', starmap(rand, repeat((), chunk_days * _DAILY_DRAWS)))
+        date_strs, months, weekdays = build_date_columns(start_date + timedelta(days=chunk_start), chunk_days)
+        seasonal_factors = [SEASONAL_FACTORS[month] for month in months]
+        flare_flags, recovery_phases, flare_carry = build_flare_schedule(
+            uniforms[0::_DAILY_DRAWS],
+            uniforms[1::_DAILY_DRAWS],
+            [0.12 + (seasonal_factor * 0.1) for seasonal_factor in seasonal_factors],
+            flare_carry,
+        )
+        # Health improves slowly over the years (1.5 points per decade, capped at 7.5).
+        baseline_healths = [
+            min(7.5, 6.0 + (day / 365.25 / 10) * 1.5) for day in range(chunk_start, chunk_start + chunk_days)
+        ]
+        weekly_patterns = [WEEKLY_PATTERNS[weekday] for weekday in weekdays]
+        yield from zip(
+            date_strs, weekly_patterns, seasonal_factors, flare_flags, recovery_phases, baseline_healths,
+            zip(*[iter(uniforms)] * _DAILY_DRAWS),
+        )
+
+
+def sample_row_to_log(row):
+    """
+    Map a generated row to an app log dict keyed by JSON_LOG_KEYS, dropping empty fields
+    like the app does. Food and exercise become lists.
+    """
+    log = {key: value for key, value in zip(JSON_LOG_KEYS, row) if value != ''}
+    for key in ('food', 'exercise'):
+        if key in log:
+            log[key] = json.loads(log[key])
+    return log
+
+
+def write_json_logs(output_path, rows):
+    """
+    Write generated rows as a JSON array of app log entries (Import → JSON in the web app).
+    Each object's text is assembled straight from the row tuple: values are written as JSON
+    strings like the app's export, and the food/exercise JSON is spliced in as-is, so no
+    per-row dict is built or re-encoded.
+    """
+    with open(output_path, 'w', buffering=WRITE_BUFFER_SIZE, encoding='utf-8') as jsonfile:
+        jsonfile.write('[')
+        separator = '{'
+        for row in rows:
+            jsonfile.write(separator)
+            jsonfile.write(','.join([
+                prefix + (value if raw else encode_basestring_ascii(str(value)))
+                for prefix, raw, value in zip(_JSON_FIELD_PREFIXES, _JSON_RAW_FIELDS, row)
+                if value != ''
+            ]))
+            separator = '},{'
+        jsonfile.write('}]' if separator != '{' else ']')
+
+
+def iter_sample_rows(num_days, base_weight, start_date, rng):
+    """
+    Yield one row tuple per day from start_date, in CSV_HEADERS order.
+    Numbers are left unstringified; food and exercise are JSON strings ('' when empty).
+    Rows are produced lazily so writers can stream them without holding the whole dataset.
+    """
+    rand = rng.random
+    current_weight = base_weight
+
+    for (date_str, weekly_pattern, seasonal_factor, flare_state, recovery_phase, baseline_health,
+         draws) in iter_day_inputs(num_days, start_date, rng):
+        (_, _, r1, r2, r3, r4, r5, r6, r7, r8, r9, r10, u_bpm, u_weight,
+         u_exercise, u_food, u_steps, u_hydration, u_energy, u_notes) = draws
+        recovery_boost = min(0.3, recovery_phase * 0.05) if 0 < recovery_phase < 7 else 0
+        if flare_state:
+            # Flare scores only depend on baseline health and noise, so map all ten draws
+            # through FLARE_SCORE_RANGES at once.
+            (fatigue, stiffness, back_pain, joint_pain, sleep, mobility, daily_function,
+             swelling, mood, irritability) = [
+                clamp_score(baseline_health + offset + noise * spread)
+                for (offset, spread), noise in zip(FLARE_SCORE_RANGES, draws[2:12])
+            ]
+            bpm = int(70 + (u_bpm * 15))
+        else:
+            sleep = clamp_score(baseline_health + (r1 * 2) + seasonal_factor + weekly_pattern + recovery_boost)
+            fatigue = clamp_score(baseline_health - (sleep - 5) * 0.8 + (r2 * 1.5))
+            stiffness = clamp_score(baseline_health - 2 - (seasonal_factor * 2) + (r3 * 1.5) + recovery_boost)
+            back_pain = clamp_score(stiffness + (r4 * 1) - 0.5)
+            joint_pain = clamp_score(stiffness * 0.7 + (r5 * 1.2))
+            mobility = clamp_score(baseline_health + 1 - (stiffness - 5) * 0.5 - (fatigue - 5) * 0.3 + (r6 * 1) + recovery_boost)
+            daily_function = clamp_score(mobility * 0.9 + (r7 * 1))
+            swelling = clamp_score(joint_pain * 0.6 + (r8 * 1))
+            mood = clamp_score(baseline_health + 0.5 + (sleep - 5) * 0.6 - (fatigue - 5) * 0.4 + (r9 * 1) + weekly_pattern + recovery_boost)
+            irritability = clamp_score(baseline_health - 2 - (mood - 5) * 0.5 - (sleep - 5) * 0.3 + (r10 * 1.5))
+            bpm = int(65 + (fatigue - 5) * 2 + (u_bpm * 8) + (seasonal_factor * 3))
+        has_exercise = u_weight < 0.4
+        current_weight += -0.02 if has_exercise else 0.01
+        current_weight = max(70, min(80, current_weight))
+        weight = round(current_weight, 1)
+        food_json = ""
+        exercise_items = ()
+        exercise_chance = 0.15 if flare_state else (0.6 if mood > 6 else 0.3)
+        # Below its threshold each uniform is uniform again on [0, threshold), so the
+        # exercise/food counts are read off the same draw instead of calling randint.
+        if u_exercise < exercise_chance:
+            num_exercise = 1 if flare_state or u_exercise < exercise_chance / 2 else 2
+            exercise_items = tuple(rng.sample(EXERCISE_TEMPLATES, num_exercise))
+        if u_food < 0.65:
+            num_food = 1 + int(u_food / 0.65 * 3)
+            food_pool = FLARE_FOODS if flare_state else HEALTHY_FOODS
+            food_json = '[' + ', '.join([
+                _FOOD_JSON_PREFIXES[template['name']]
+                + f"{round(template['calories'] * (1 + (rand() - 0.5) * 0.15))}, \"protein\": "
+                + f"{round(template['protein'] * (1 + (rand() - 0.5) * 0.15), 1)!r}}}"
+                for template in rng.choices(food_pool, k=num_food)
+            ]) + ']'
+        weather_sensitivity = clamp_score(5 + (stiffness - 5) * 0.5 - seasonal_factor * 2)
+        steps = max(1000, min(15000, round(6000 + (mobility - 5) * 800 + (mood - 5) * 500 - (fatigue - 5) * 400 + (u_steps * 2000 - 1000))))
+        hydration = round(6 + (1 if exercise_items else 0) + (u_hydration * 2 - 1), 1)
+        energy_clarity = ""
+        if sleep >= 7 and mood >= 7:
+            energy_clarity = rng.choice(HIGH_ENERGY_CLARITY) if u_energy < 0.7 else rng.choice(ENERGY_CLARITY_OPTIONS)
+        elif sleep < 5 or mood < 5:
+            energy_clarity = rng.choice(LOW_ENERGY_CLARITY) if u_energy < 0.6 else rng.choice(ENERGY_CLARITY_OPTIONS)
+        else:
+            energy_clarity = rng.choice(ENERGY_CLARITY_OPTIONS) if u_energy < 0.4 else ""
+        notes = ""
+        if u_notes < NOTES_CHANCE:
+            if flare_state:
+                notes = "Flare-up day - increased symptoms"
+            elif 0 < recovery_phase < 3:
+                notes = "Recovering from flare - feeling better"
+            elif seasonal_factor < -0.2:
+                notes = "Winter symptoms - more stiffness"
+            elif sleep < 5:
+                notes = "Poor sleep last night"
+            else:
+                # u_notes is uniform on [0, NOTES_CHANCE) here, so rescale it for the
+                # weighted pick instead of drawing again.
+                notes = NOTES_OPTIONS[bisect(_NOTES_CUM_WEIGHTS, u_notes / NOTES_CHANCE * _NOTES_CUM_WEIGHTS[-1])]
+        exercise_json = dump_exercise_items(exercise_items) if exercise_items else ""
+        yield (
+            date_str, bpm, weight, fatigue, stiffness, back_pain, sleep, joint_pain,
+            mobility, daily_function, swelling, 'Yes' if flare_state else 'No', mood,
+            irritability, weather_sensitivity, steps, hydration, energy_clarity,
+            '', '', '', food_json, exercise_json, notes
+        )
 
 
-def generate_sample_csv_data(num_days=90, base_weight=75.0, output_path=None):
-    """Generate randomized health data and save to CSV. Returns path to file."""
+def tally_sample_rows(rows, summary):
+    """
+    Pass rows through unchanged while accumulating summary totals in one pass.
+    summary gets 'days', 'flare_days' and running sums for bpm, weight, fatigue and sleep.
+    """
+    days = flare_days = 0
+    bpm = weight = fatigue = sleep = 0
+    for row in rows:
+        days += 1
+        bpm += row[1]
+        weight += row[2]
+        fatigue += row[3]
+        sleep += row[6]
+        if row[11] == 'Yes':
+            flare_days += 1
+        yield row
+    summary.update(days=days, flare_days=flare_days, bpm=bpm, weight=weight,
+                   fatigue=fatigue, sleep=sleep)
+
+
+def generate_sample_csv_data(num_days=90, base_weight=75.0, output_path=None, output_format='csv',
+                             seed=None, rng=None):
+    """
+    Generate randomized health data and save it. Returns path to file.
+    output_format 'csv' (default) matches the app's CSV import; 'json' writes the app's log
+    array directly, which the web app imports without CSV parsing.
+    Pass seed (or a random.Random as rng) for reproducible output; the global random state
+    is never used.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"output_format must be one of {OUTPUT_FORMATS}")
     if output_path is None:
-        output_path = config.PROJECT_ROOT / f'health_data_sample_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+        output_path = config.PROJECT_ROOT / f'health_data_sample_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{output_format}'
     try:
         today = datetime.now()
         end_date = today - timedelta(days=1)
         start_date = end_date - timedelta(days=num_days - 1)
-        batch_size = 1000
-        random_batch = [random.random() for _ in range(batch_size)]
-        random_index = 0
-
-        def get_random():
-            nonlocal random_index, random_batch
-            if random_index >= len(random_batch):
-                random_batch = [random.random() for _ in range(batch_size)]
-                random_index = 0
-            result = random_batch[random_index]
-            random_index += 1
-            return result
-
-        healthy_foods = [
-            {'name': 'Grilled chicken, 200g', 'calories': 330, 'protein': 62},
-            {'name': 'Brown rice, 150g', 'calories': 165, 'protein': 3.5},
-            {'name': 'Steamed vegetables', 'calories': 50, 'protein': 2},
-            {'name': 'Salmon fillet, 180g', 'calories': 360, 'protein': 50},
-            {'name': 'Quinoa salad', 'calories': 220, 'protein': 8},
-            {'name': 'Greek yogurt, 150g', 'calories': 130, 'protein': 11},
-            {'name': 'Oatmeal with berries', 'calories': 200, 'protein': 5},
-            {'name': 'Mixed nuts, 30g', 'calories': 180, 'protein': 5},
-            {'name': 'Eggs, 2 large', 'calories': 140, 'protein': 12},
-            {'name': 'Grilled fish, 200g', 'calories': 280, 'protein': 45}
-        ]
-        comfort_foods = [
-            {'name': 'Pizza slice', 'calories': 280, 'protein': 12},
-            {'name': 'Pasta, 200g', 'calories': 250, 'protein': 8},
-            {'name': 'Bread, 2 slices', 'calories': 160, 'protein': 6},
-            {'name': 'Chocolate bar', 'calories': 220, 'protein': 3}
-        ]
-        exercise_templates = [
-            'Walking, 30 minutes', 'Yoga, 20 minutes', 'Swimming, 25 minutes',
-            'Cycling, 40 minutes', 'Stretching, 15 minutes', 'Light jogging, 20 minutes',
-            'Pilates, 30 minutes', 'Tai Chi, 25 minutes', 'Water aerobics, 30 minutes',
-            'Physical therapy exercises, 20 minutes', 'Gentle strength training, 15 minutes',
-            'Balance exercises, 10 minutes'
-        ]
-        current_weight = base_weight
-        flare_state = False
-        flare_duration = 0
-        recovery_phase = 0
-        baseline_health = 6.0
-        entries = []
-
-        for day in range(num_days):
-            date = start_date + timedelta(days=day)
-            date_str = date.strftime('%Y-%m-%d')
-            month = date.month - 1
-            day_of_week = date.weekday()
-            seasonal_factor = get_seasonal_factor(month)
-            weekly_pattern = get_weekly_pattern(day_of_week)
-            years_progress = day / 365.25
-            baseline_health = min(7.5, 6.0 + (years_progress / 10) * 1.5)
-            flare_chance = 0.12 + (seasonal_factor * 0.1)
-            if flare_duration > 0:
-                flare_duration -= 1
-                if flare_duration == 0:
-                    flare_state = False
-                    recovery_phase = 1
-            elif get_random() < flare_chance:
-                flare_state = True
-                flare_duration = random.randint(2, 5)
+        if rng is None:
+            rng = random.Random(seed)
+        summary = {}
+        rows = tally_sample_rows(iter_sample_rows(num_days, base_weight, start_date, rng), summary)
+        # Write next to the target and rename into place, so an interrupted run never leaves
+        # a truncated file that looks importable.
+        tmp_path = Path(f'{output_path}.tmp')
+        try:
+            if output_format == 'json':
+                write_json_logs(tmp_path, rows)
             else:
-                recovery_phase += 1
-            recovery_boost = min(0.3, recovery_phase * 0.05) if 0 < recovery_phase < 7 else 0
-            r1, r2, r3, r4, r5, r6, r7, r8, r9, r10 = [get_random() for _ in range(10)]
-            if flare_state:
-                fatigue = max(1, min(10, round(baseline_health - 3 + (r1 * 3))))
-                stiffness = max(1, min(10, round(baseline_health - 2.5 + (r2 * 3))))
-                back_pain = max(1, min(10, round(baseline_health - 2 + (r3 * 3))))
-                joint_pain = max(1, min(10, round(baseline_health - 2.5 + (r4 * 2.5))))
-                sleep = max(1, min(10, round(baseline_health - 4 + (r5 * 2))))
-                mobility = max(1, min(10, round(baseline_health - 4 + (r6 * 2))))
-                daily_function = max(1, min(10, round(baseline_health - 3.5 + (r7 * 2.5))))
-                swelling = max(1, min(10, round(baseline_health - 3 + (r8 * 2.5))))
-                mood = max(1, min(10, round(baseline_health - 3.5 + (r9 * 2))))
-                irritability = max(1, min(10, round(baseline_health - 2 + (r10 * 3))))
-                bpm = int(70 + (get_random() * 15))
-            else:
-                sleep = max(1, min(10, round(baseline_health + (r1 * 2) + seasonal_factor + weekly_pattern + recovery_boost)))
-                fatigue = max(1, min(10, round(baseline_health - (sleep - 5) * 0.8 + (r2 * 1.5))))
-                stiffness = max(1, min(10, round(baseline_health - 2 - (seasonal_factor * 2) + (r3 * 1.5) + recovery_boost)))
-                back_pain = max(1, min(10, round(stiffness + (r4 * 1) - 0.5)))
-                joint_pain = max(1, min(10, round(stiffness * 0.7 + (r5 * 1.2))))
-                mobility = max(1, min(10, round(baseline_health + 1 - (stiffness - 5) * 0.5 - (fatigue - 5) * 0.3 + (r6 * 1) + recovery_boost)))
-                daily_function = max(1, min(10, round(mobility * 0.9 + (r7 * 1))))
-                swelling = max(1, min(10, round(joint_pain * 0.6 + (r8 * 1))))
-                mood = max(1, min(10, round(baseline_health + 0.5 + (sleep - 5) * 0.6 - (fatigue - 5) * 0.4 + (r9 * 1) + weekly_pattern + recovery_boost)))
-                irritability = max(1, min(10, round(baseline_health - 2 - (mood - 5) * 0.5 - (sleep - 5) * 0.3 + (r10 * 1.5))))
-                bpm = int(65 + (fatigue - 5) * 2 + (get_random() * 8) + (seasonal_factor * 3))
-            has_exercise = get_random() < 0.4
-            current_weight += -0.02 if has_exercise else 0.01
-            current_weight = max(70, min(80, current_weight))
-            weight = round(current_weight, 1)
-            food_items = []
-            exercise_items = []
-            exercise_chance = 0.15 if flare_state else (0.6 if mood > 6 else 0.3)
-            if get_random() < exercise_chance:
-                num_exercise = 1 if flare_state else random.randint(1, 2)
-                exercise_items = random.sample(exercise_templates, min(num_exercise, len(exercise_templates)))
-            if get_random() < 0.65:
-                num_food = random.randint(1, 3)
-                food_pool = healthy_foods if (mood > 6 and not flare_state) else (healthy_foods + comfort_foods if flare_state else healthy_foods)
-                for _ in range(num_food):
-                    template = random.choice(food_pool)
-                    food_items.append({
-                        'name': template['name'],
-                        'calories': round(template['calories'] * (1 + (get_random() - 0.5) * 0.15)),
-                        'protein': round(template['protein'] * (1 + (get_random() - 0.5) * 0.15), 1)
-                    })
-            weather_sensitivity = max(1, min(10, round(5 + (stiffness - 5) * 0.5 - seasonal_factor * 2)))
-            steps = max(1000, min(15000, round(6000 + (mobility - 5) * 800 + (mood - 5) * 500 - (fatigue - 5) * 400 + (get_random() * 2000 - 1000))))
-            hydration = round(6 + (1 if exercise_items else 0) + (get_random() * 2 - 1), 1)
-            energy_clarity_options = ["High Energy", "Moderate Energy", "Low Energy", "Mental Clarity", "Brain Fog", "Good Concentration", "Poor Concentration", "Mental Fatigue", "Focused", "Distracted"]
-            energy_clarity = ""
-            r_energy = get_random()
-            if sleep >= 7 and mood >= 7:
-                energy_clarity = random.choice(["High Energy", "Mental Clarity", "Good Concentration"]) if r_energy < 0.7 else random.choice(energy_clarity_options)
-            elif sleep < 5 or mood < 5:
-                energy_clarity = random.choice(["Low Energy", "Brain Fog", "Mental Fatigue"]) if r_energy < 0.6 else random.choice(energy_clarity_options)
-            else:
-                energy_clarity = random.choice(energy_clarity_options) if r_energy < 0.4 else ""
-            notes = ""
-            if get_random() < 0.12:
-                if flare_state:
-                    notes = "Flare-up day - increased symptoms"
-                elif 0 < recovery_phase < 3:
-                    notes = "Recovering from flare - feeling better"
-                elif seasonal_factor < -0.2:
-                    notes = "Winter symptoms - more stiffness"
-                elif sleep < 5:
-                    notes = "Poor sleep last night"
-                else:
-                    notes = random.choice([
-                        "Feeling better today", "Morning stiffness was manageable",
-                        "Had a good night's sleep", "Some joint pain in the morning",
-                        "Feeling tired", "Good day overall", "Minor flare symptoms",
-                        "Exercised today, feeling good"
-                    ])
-            food_json = json.dumps(food_items) if food_items else ""
-            exercise_json = json.dumps(exercise_items) if exercise_items else ""
-            entry = {
-                'Date': date_str, 'BPM': str(bpm), 'Weight': str(weight), 'Fatigue': str(fatigue),
-                'Stiffness': str(stiffness), 'Back Pain': str(back_pain), 'Sleep': str(sleep),
-                'Joint Pain': str(joint_pain), 'Mobility': str(mobility), 'Daily Function': str(daily_function),
-                'Swelling': str(swelling), 'Flare': 'Yes' if flare_state else 'No', 'Mood': str(mood),
-                'Irritability': str(irritability), 'Weather Sensitivity': str(weather_sensitivity),
-                'Steps': str(steps), 'Hydration': str(hydration), 'Energy Clarity': energy_clarity,
-                'Stressors': '', 'Symptoms': '', 'Pain Location': '', 'Food': food_json,
-                'Exercise': exercise_json, 'Notes': notes
-            }
-            entries.append(entry)
-
-        headers = [
-            'Date', 'BPM', 'Weight', 'Fatigue', 'Stiffness', 'Back Pain',
-            'Sleep', 'Joint Pain', 'Mobility', 'Daily Function', 'Swelling',
-            'Flare', 'Mood', 'Irritability', 'Weather Sensitivity', 'Steps', 'Hydration',
-            'Energy Clarity', 'Stressors', 'Symptoms', 'Pain Location', 'Food', 'Exercise', 'Notes'
-        ]
-        def escape_csv_value(value):
-            if value is None or value == '':
-                return ''
-            value_str = str(value)
-            if ',' in value_str or '"' in value_str or '\n' in value_str:
-                return '"' + value_str.replace('"', '""') + '"'
-            return value_str
-        with open(output_path, 'w', newline='', encoding='utf-8') as csvfile:
-            csvfile.write(','.join(headers) + '\n')
-            for entry in entries:
-                row = [escape_csv_value(entry.get(h, '')) for h in headers]
-                csvfile.write(','.join(row) + '\n')
-        config.logger.info(f"Generated {len(entries)} entries and saved to '{output_path}'")
+                # csv.writer quotes fields containing commas, quotes or newlines in C; numbers are
+                # stringified there too, and writerows consumes the row generator as it goes.
+                with open(tmp_path, 'w', buffering=WRITE_BUFFER_SIZE, newline='', encoding='utf-8') as csvfile:
+                    writer = csv.writer(csvfile, lineterminator='\n')
+                    writer.writerow(CSV_HEADERS)
+                    writer.writerows(rows)
+            os.replace(tmp_path, output_path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        days = summary['days']
+        per_day = max(days, 1)
+        config.logger.info(
+            f"Generated {days} entries and saved to '{output_path}' "
+            f"({summary['flare_days']} flare days; avg BPM {summary['bpm'] / per_day:.0f}, "
+            f"weight {summary['weight'] / per_day:.1f} kg, fatigue {summary['fatigue'] / per_day:.1f}, "
+            f"sleep {summary['sleep'] / per_day:.1f})"
+        )
         return str(output_path)
     except Exception as e:
         config.logger.error(f"Error generating CSV data: {e}", exc_info=True)
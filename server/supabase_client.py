@@ -5,17 +5,23 @@ import sys
 import json
 import csv
 import random
+import time
+from itertools import islice
 from datetime import datetime, timedelta
 from pathlib import Path
 
 from . import config
 from . import encryption
-from .sample_data import get_seasonal_factor, get_weekly_pattern
+from .sample_data import iter_sample_rows, sample_row_to_log
 
 supabase_client = None
 supabase_service_client = None
 SUPABASE_AVAILABLE = False
 
+# Successful connection probes are reused for this long so status polling does not hit Supabase every call.
+CONNECTION_PROBE_TTL = 60.0
+_connection_probe_ok = None  # (client, time.monotonic()) of the last successful probe
+
 
 def check_supabase_availability():
     """Check if Supabase is available (system/venv or local lib)."""
@@ -128,6 +134,27 @@ def _import_supabase_create_client():
         raise ImportError(f"Supabase create_client import failed (and diagnostics failed): {e}")
 
 
+def probe_supabase_connection(client):
+    """
+    Check that client can read anonymized_data. Returns (ok, error message or None).
+    A success is cached for CONNECTION_PROBE_TTL seconds for that client object only; failures
+    are never cached so a fixed configuration is picked up on the next call.
+    """
+    global _connection_probe_ok
+    now = time.monotonic()
+    # Keyed on the client object: a client rebuilt for new credentials or URL is probed afresh
+    cached = _connection_probe_ok
+    if cached is not None and cached[0] is client and now - cached[1] < CONNECTION_PROBE_TTL:
+        return True, None
+    try:
+        client.table('anonymized_data').select('id').limit(1).execute()
+    except Exception as e:
+        _connection_probe_ok = None
+        return False, str(e)
+    _connection_probe_ok = (client, now)
+    return True, None
+
+
 def run_sql(sql):
     """Execute SQL via DATABASE_URL or Supabase RPC."""
     if config.DATABASE_URL:
@@ -218,31 +245,35 @@ def export_supabase_data(output_path=None, condition=None):
         return None
     try:
         headers = ['id', 'medical_condition', 'created_at', 'updated_at']
-        log_headers = []
-        if data:
-            first_log = data[0].get('anonymized_logs') or data[0].get('anonymized_log', {})
-            if isinstance(first_log, dict):
-                log_headers = list(first_log.keys())
+        logs = []
+        for record in data:
+            encrypted_log = record.get('anonymized_logs') or record.get('anonymized_log')
+            log_data = encryption.decrypt_anonymized_data(encrypted_log) if encrypted_log else {}
+            logs.append(log_data if isinstance(log_data, dict) else {})
+        # Logs omit empty fields (the app's sync and the sample generator both drop them), so
+        # the columns are the union of every log's keys, in first-seen order
+        log_headers = list(dict.fromkeys(key for log_data in logs for key in log_data))
         all_headers = headers + log_headers
+        def export_rows():
+            for record, log_data in zip(data, logs):
+                row = [
+                    record.get('id', ''),
+                    record.get('medical_condition', ''),
+                    record.get('created_at', ''),
+                    record.get('updated_at', ''),
+                ]
+                for key in log_headers:
+                    value = log_data.get(key, '')
+                    if isinstance(value, (list, dict)):
+                        value = json.dumps(value)
+                    row.append(value)
+                yield row
+
+        # Plain csv.writer over positional rows: no per-row dict for DictWriter to re-map by key.
         with open(output_path, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=all_headers)
-            writer.writeheader()
-            for record in data:
-                row = {
-                    'id': record.get('id', ''),
-                    'medical_condition': record.get('medical_condition', ''),
-                    'created_at': record.get('created_at', ''),
-                    'updated_at': record.get('updated_at', '')
-                }
-                encrypted_log = record.get('anonymized_logs') or record.get('anonymized_log')
-                log_data = encryption.decrypt_anonymized_data(encrypted_log) if encrypted_log else {}
-                if isinstance(log_data, dict):
-                    for key in log_headers:
-                        value = log_data.get(key, '')
-                        if isinstance(value, (list, dict)):
-                            value = json.dumps(value)
-                        row[key] = value
-                writer.writerow(row)
+            writer = csv.writer(csvfile)
+            writer.writerow(all_headers)
+            writer.writerows(export_rows())
         config.logger.info(f"Exported {len(data)} records to {output_path}")
         return str(output_path)
     except Exception as e:
@@ -250,6 +281,43 @@ def export_supabase_data(output_path=None, condition=None):
         return None
 
 
+def _is_row_level_error(exc):
+    """True if PostgREST rejected an insert for the data in it: a PostgreSQL data exception or
+    integrity violation (SQLSTATE class 22 or 23). Transport, auth, permission and schema errors
+    fail every row alike, so retrying smaller batches cannot help."""
+    code = getattr(exc, 'code', None)
+    return isinstance(code, str) and code[:2] in ('22', '23')
+
+
+def _insert_bisecting(client, table, rows):
+    """Retry rows whose bulk insert failed at row level, halving the batch until each bad row
+    is isolated. Isolated bad rows are logged and skipped; the rest are still inserted.
+
+    A single bad record costs about 2*log2(len(rows)) requests instead of one request per row.
+    Only row-level failures are split further; any other error stops the retry, since every
+    remaining row would fail the same way. Returns (rows inserted, that error or None).
+    """
+    if len(rows) <= 1:
+        return 0, None
+    mid = len(rows) // 2
+    inserted = 0
+    for half in (rows[:mid], rows[mid:]):
+        try:
+            client.table(table).insert(half).execute()
+            inserted += len(half)
+        except Exception as e:
+            if not _is_row_level_error(e):
+                return inserted, e
+            if len(half) == 1:
+                config.logger.error(f"Skipping rejected row in {table}: {e}")
+                continue
+            half_inserted, error = _insert_bisecting(client, table, half)
+            inserted += half_inserted
+            if error is not None:
+                return inserted, error
+    return inserted, None
+
+
 def generate_and_post_sample_data_to_supabase(num_days=90, medical_condition="Medical Condition", base_weight=75.0):
     """Generate and post sample anonymized data to Supabase. Returns count posted."""
     global SUPABASE_AVAILABLE
@@ -262,111 +330,32 @@ def generate_and_post_sample_data_to_supabase(num_days=90, medical_condition="Me
     if not client:
         return 0
     try:
-        today = datetime.now()
-        end_date = today - timedelta(days=1)
+        end_date = datetime.now() - timedelta(days=1)
         start_date = end_date - timedelta(days=num_days - 1)
-        healthy_foods = [
-            {'name': 'Grilled chicken, 200g', 'calories': 330, 'protein': 62},
-            {'name': 'Brown rice, 150g', 'calories': 165, 'protein': 3.5},
-            {'name': 'Steamed vegetables', 'calories': 50, 'protein': 2},
-            {'name': 'Salmon fillet, 180g', 'calories': 360, 'protein': 50},
-        ]
-        exercise_templates = [
-            'Walking, 30 minutes', 'Yoga, 20 minutes', 'Swimming, 25 minutes',
-            'Cycling, 40 minutes', 'Stretching, 15 minutes'
-        ]
-        random_batch = [random.random() for _ in range(1000)]
-        random_index = [0]
-        def get_random():
-            if random_index[0] >= len(random_batch):
-                random_batch[:] = [random.random() for _ in range(1000)]
-                random_index[0] = 0
-            result = random_batch[random_index[0]]
-            random_index[0] += 1
-            return result
-        current_weight = base_weight
-        flare_state = False
-        flare_duration = 0
-        recovery_phase = 0
-        baseline_health = 6.0
+        # Same generator as the CSV/JSON sample files, so both kinds of sample data share one model.
+        rows = iter_sample_rows(num_days, base_weight, start_date, random.Random())
         posted_count = 0
-        batch_data = []
-        for day in range(num_days):
-            date = start_date + timedelta(days=day)
-            date_str = date.strftime('%Y-%m-%d')
-            month = date.month - 1
-            day_of_week = date.weekday()
-            seasonal_factor = get_seasonal_factor(month)
-            weekly_pattern = get_weekly_pattern(day_of_week)
-            years_progress = day / 365.25
-            baseline_health = min(7.5, 6.0 + (years_progress / 10) * 1.5)
-            flare_chance = 0.12 + (seasonal_factor * 0.1)
-            if flare_duration > 0:
-                flare_duration -= 1
-                if flare_duration == 0:
-                    flare_state = False
-                    recovery_phase = 1
-            elif get_random() < flare_chance:
-                flare_state = True
-                flare_duration = random.randint(2, 5)
-            else:
-                recovery_phase += 1
-            recovery_boost = min(0.3, recovery_phase * 0.05) if 0 < recovery_phase < 7 else 0
-            r_vals = [get_random() for _ in range(10)]
-            if flare_state:
-                fatigue = max(1, min(10, round(baseline_health - 3 + (r_vals[0] * 3))))
-                stiffness = max(1, min(10, round(baseline_health - 2.5 + (r_vals[1] * 3))))
-                back_pain = max(1, min(10, round(baseline_health - 2 + (r_vals[2] * 3))))
-                sleep = max(1, min(10, round(baseline_health - 4 + (r_vals[3] * 2))))
-                mood = max(1, min(10, round(baseline_health - 3.5 + (r_vals[4] * 2))))
-            else:
-                sleep = max(1, min(10, round(baseline_health + (r_vals[0] * 2) + seasonal_factor + weekly_pattern + recovery_boost)))
-                fatigue = max(1, min(10, round(baseline_health - (sleep - 5) * 0.8 + (r_vals[1] * 1.5))))
-                stiffness = max(1, min(10, round(baseline_health - 2 - (seasonal_factor * 2) + (r_vals[2] * 1.5))))
-                back_pain = max(1, min(10, round(stiffness + (r_vals[3] * 1) - 0.5)))
-                mood = max(1, min(10, round(baseline_health + 0.5 + (sleep - 5) * 0.6 - (fatigue - 5) * 0.4 + (r_vals[4] * 1))))
-            has_exercise = get_random() < 0.4
-            current_weight += -0.02 if has_exercise else 0.01
-            current_weight = max(70, min(80, current_weight))
-            weight = round(current_weight, 1)
-            food_items = []
-            exercise_items = []
-            if get_random() < 0.65:
-                for _ in range(random.randint(1, 3)):
-                    t = random.choice(healthy_foods)
-                    food_items.append({'name': t['name'], 'calories': round(t['calories'] * (1 + (get_random() - 0.5) * 0.15)), 'protein': round(t['protein'] * (1 + (get_random() - 0.5) * 0.15), 1)})
-            if get_random() < (0.15 if flare_state else 0.6):
-                exercise_items = random.sample(exercise_templates, min(1 if flare_state else random.randint(1, 2), len(exercise_templates)))
-            r_extra = [get_random() for _ in range(5)]
-            anonymized_log = {
-                'date': date_str, 'bpm': int(65 + (fatigue - 5) * 2 + (r_extra[0] * 8)), 'weight': weight,
-                'fatigue': fatigue, 'stiffness': stiffness, 'backPain': back_pain, 'sleep': sleep,
-                'jointPain': max(1, min(10, round(stiffness * 0.7 + (r_extra[1] * 1.2)))),
-                'mobility': max(1, min(10, round(baseline_health + 1 - (stiffness - 5) * 0.5 + (r_extra[2] * 1)))),
-                'dailyFunction': max(1, min(10, round(baseline_health + 0.5 + (r_extra[3] * 1)))),
-                'swelling': max(1, min(10, round(baseline_health - 1 + (r_extra[4] * 1.5)))),
-                'flare': 'Yes' if flare_state else 'No', 'mood': mood,
-                'irritability': max(1, min(10, round(baseline_health - 2 - (mood - 5) * 0.5 + (get_random() * 1.5)))),
-                'weatherSensitivity': max(1, min(10, round(5 + (stiffness - 5) * 0.5))),
-                'steps': max(1000, min(15000, round(6000 + (get_random() * 2000 - 1000)))),
-                'hydration': round(6 + (get_random() * 2 - 1), 1), 'food': food_items, 'exercise': exercise_items
-            }
-            batch_data.append({'medical_condition': medical_condition, 'anonymized_logs': encryption.encrypt_anonymized_data(anonymized_log)})
-            if len(batch_data) >= 100 or day == num_days - 1:
-                try:
-                    client.table('anonymized_data').insert(batch_data).execute()
-                    posted_count += len(batch_data)
-                    config.logger.info(f"Posted batch: {posted_count}/{num_days} records...")
-                    batch_data = []
-                except Exception as e:
-                    config.logger.error(f"Error posting batch: {e}")
-                    for record in batch_data:
-                        try:
-                            client.table('anonymized_data').insert(record).execute()
-                            posted_count += 1
-                        except Exception:
-                            pass
-                    batch_data = []
+        while True:
+            batch_data = [
+                {'medical_condition': medical_condition,
+                 'anonymized_logs': encryption.encrypt_anonymized_data(sample_row_to_log(row))}
+                for row in islice(rows, 100)
+            ]
+            if not batch_data:
+                break
+            try:
+                client.table('anonymized_data').insert(batch_data).execute()
+                posted_count += len(batch_data)
+                config.logger.info(f"Posted batch: {posted_count}/{num_days} records...")
+            except Exception as e:
+                config.logger.error(f"Error posting batch: {e}")
+                if not _is_row_level_error(e):
+                    break  # connection, auth or schema problem: later batches would fail the same way
+                inserted, error = _insert_bisecting(client, 'anonymized_data', batch_data)
+                posted_count += inserted
+                if error is not None:
+                    config.logger.error(f"Stopped retrying failed sample rows: {error}")
+                    break
         config.logger.info(f"Generated and posted {posted_count} sample records to Supabase")
         return posted_count
     except Exception as e: